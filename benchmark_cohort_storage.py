@@ -0,0 +1,111 @@
+import argparse
+import os
+import random
+import time
+import uuid
+
+parser = argparse.ArgumentParser(
+    description="Compare the 'documents' and 'vectors' cohort storage layouts"
+)
+parser.add_argument("--users", type=int, default=20000)
+parser.add_argument("--emails", type=int, default=3)
+parser.add_argument("--cohorts", type=int, default=6)
+parser.add_argument("--queries", type=int, default=500)
+parser.add_argument(
+    "--mongo-uri",
+    default="mongodb://localhost:27017/cdp_benchmark",
+    help="Scratch database; its cohort collections are dropped",
+)
+args = parser.parse_args()
+os.environ["MONGO_URI"] = args.mongo_uri
+
+from services.mongo_service import connect_to_mongo, ensure_indexes
+from services.cohort_service import (
+    ensure_cohort_indexes,
+    fetch_cohort_page,
+    save_user_cohorts,
+)
+from utils.segmentation_prompt import cohorts as COHORTS
+
+COLLECTIONS = {
+    "documents": ["cohort_data"],
+    "vectors": ["cohort_vectors", "cohort_rank"],
+}
+
+
+def make_users():
+    rng = random.Random(7)
+    users = []
+    for _ in range(args.users):
+        user_id = str(uuid.uuid4())
+        emails = [f"{uuid.uuid4().hex[:12]}@example.com" for _ in range(args.emails)]
+        cohorts = rng.sample(COHORTS, args.cohorts)
+        entries = [
+            {
+                "user_id": user_id,
+                "email": email,
+                "cohort": cohort,
+                "similarity_score": rng.randint(10, 100),
+            }
+            for email in emails
+            for cohort in cohorts
+        ]
+        users.append((user_id, emails, entries))
+    return users
+
+
+def collection_stats(db, layout):
+    totals = {"count": 0, "size": 0, "storageSize": 0, "totalIndexSize": 0}
+    index_entries = 0
+    for name in COLLECTIONS[layout]:
+        stats = db.command("collStats", name)
+        for key in totals:
+            totals[key] += stats.get(key, 0)
+        # None of these indexes is multikey: one entry per document and index
+        index_entries += stats.get("count", 0) * stats.get("nindexes", 0)
+    totals["indexEntries"] = index_entries
+    return totals
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+if __name__ == "__main__":
+    db = connect_to_mongo().get_default_database()
+    for names in COLLECTIONS.values():
+        for name in names:
+            db[name].drop()
+    ensure_indexes()
+    ensure_cohort_indexes()
+
+    users = make_users()
+    for layout in COLLECTIONS:
+        start = time.perf_counter()
+        written = 0
+        for user_id, emails, entries in users:
+            written += save_user_cohorts(user_id, emails, entries, layout=layout)
+        write_seconds = time.perf_counter() - start
+
+        latencies = []
+        for _ in range(args.queries):
+            cohort = random.choice(COHORTS)
+            offset = random.choice([0, 0, 0, 100, 1000])
+            start = time.perf_counter()
+            fetch_cohort_page(cohort, offset, 10, layout=layout)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        stats = collection_stats(db, layout)
+        print(f"---------- {layout} ----------")
+        print(f"documents written per user   {written / len(users):8.1f}")
+        print(f"segmentation write time      {write_seconds / len(users) * 1000:8.2f} ms/user")
+        print(f"documents stored             {stats['count']:8d}")
+        print(f"data size                    {stats['size'] / 1024 ** 2:8.1f} MiB")
+        print(f"storage size                 {stats['storageSize'] / 1024 ** 2:8.1f} MiB")
+        print(f"index size                   {stats['totalIndexSize'] / 1024 ** 2:8.1f} MiB")
+        print(f"index entries per user       {stats['indexEntries'] / len(users):8.1f}")
+        print(
+            f"cohort page latency          p50 {percentile(latencies, 0.5):6.2f} ms   "
+            f"p99 {percentile(latencies, 0.99):6.2f} ms"
+        )
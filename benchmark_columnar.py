@@ -0,0 +1,102 @@
+import argparse
+import os
+import resource
+import time
+import numpy as np
+from services.columnar_service import ColumnarProfileStore, ENCODED_COLUMNS
+from utils.segmentation_prompt import cohorts as COHORTS
+
+# Synthetic vocabularies roughly shaped like the ingested data
+VOCAB = {
+    "gender": ["Male", "Female", "Other"],
+    "income": [
+        "$0-$29,999",
+        "$30,000-$49,999",
+        "$50,000-$69,999",
+        "$70,000-$89,999",
+        "$90,000-$110,000",
+        "$110,000+",
+    ],
+    "education": ["High School", "Bachelor's", "Master's", "PhD"],
+    "state": [f"State {i}" for i in range(50)] + ["California"],
+    "country": ["USA", "Canada", "India", "UK"],
+    "city": [f"City {i}" for i in range(20000)],
+}
+
+
+def rss_bytes():
+    # Current resident set size; falls back to the peak where /proc is unavailable
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def build_store(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    columns = {
+        name: rng.integers(0, len(VOCAB[name]), rows) for name in ENCODED_COLUMNS
+    }
+    age = rng.integers(18, 80, rows).astype(np.int16)
+    cohorts = rng.integers(0, 1 << len(COHORTS), rows).astype(np.uint16)
+
+    store = ColumnarProfileStore()
+    store.load_arrays(
+        [f"user-{i}" for i in range(rows)], age, columns, VOCAB, cohorts
+    )
+    return store
+
+
+def time_query(label, fn, repeat):
+    fn()  # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(
+        f"{label:<45} p50 {timings[len(timings) // 2]:8.2f} ms   "
+        f"max {timings[-1]:8.2f} ms   count {result[0]}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the columnar profile store")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    store = build_store(args.rows)
+    print(f"Built {args.rows:,} rows in {time.perf_counter() - start:.1f} s")
+    # The arrays are only part of the footprint: the user_id -> row dict and the
+    # vocabularies are ordinary Python objects, so report the process growth too.
+    print(f"Column arrays: {store.nbytes() / 1024 ** 2:.1f} MiB")
+    print(f"Resident memory growth: {(rss_bytes() - rss_before) / 1024 ** 2:.1f} MiB")
+
+    time_query(
+        "25-34 females in California in fitness",
+        lambda: store.count(
+            {
+                "age_min": 25,
+                "age_max": 34,
+                "gender": ["Female"],
+                "state": ["California"],
+                "cohorts": ["fitness"],
+            }
+        ),
+        args.repeat,
+    )
+    time_query(
+        "travel cohort grouped by gender",
+        lambda: store.count({"cohorts": ["travel"]}, ["gender"]),
+        args.repeat,
+    )
+    time_query(
+        "USA grouped by state and income",
+        lambda: store.count({"country": ["USA"]}, ["state", "income"]),
+        args.repeat,
+    )
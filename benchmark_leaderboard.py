@@ -0,0 +1,93 @@
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from services.leaderboard_service import CohortLeaderboard
+
+COHORTS = ["travel", "tech", "fitness"]
+
+
+def synthetic_fetch(rows):
+    # Pre-sorted synthetic cohort data standing in for MongoDB
+    start = datetime(2025, 1, 1)
+    data = {
+        cohort: sorted(
+            (
+                {
+                    "email": f"{cohort}-{i}@example.com",
+                    "similarity_score": random.randint(0, 100),
+                    "updated_at": start + timedelta(seconds=i),
+                }
+                for i in range(rows)
+            ),
+            key=lambda e: (-e["similarity_score"], -e["updated_at"].timestamp(), e["email"]),
+        )
+        for cohort in COHORTS
+    }
+    return lambda cohort, offset, limit: data[cohort][offset : offset + limit]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def report(label, latencies):
+    print(
+        f"{label:<40} p50 {percentile(latencies, 0.5):8.3f} ms   "
+        f"p99 {percentile(latencies, 0.99):8.3f} ms   max {max(latencies):8.3f} ms   "
+        f"({len(latencies)} requests)"
+    )
+
+
+def bench_in_process(requests_count, update_every):
+    board = CohortLeaderboard(COHORTS, 100, fetch_page=synthetic_fetch(10000))
+    board.load()
+    latencies = []
+    for i in range(requests_count):
+        if update_every and i % update_every == 0:
+            # A top-scoring segmentation write lands on every board and
+            # invalidates its cached pages
+            email = f"writer-{i}@example.com"
+            board.update_user(
+                [email],
+                [
+                    {"email": email, "cohort": cohort, "similarity_score": 100}
+                    for cohort in COHORTS
+                ],
+            )
+        cohort = random.choice(COHORTS)
+        offset = random.choice([0, 0, 0, 10, 20])
+        start = time.perf_counter()
+        body = board.page_bytes(cohort, offset, 10)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert body is not None
+    return latencies
+
+
+def bench_http(url, requests_count):
+    import requests
+
+    session = requests.Session()
+    latencies = []
+    for _ in range(requests_count):
+        cohort = random.choice(COHORTS)
+        start = time.perf_counter()
+        session.get(f"{url}/api/cohort/users", params={"cohort": cohort, "limit": 10})
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark hot cohort first pages")
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument(
+        "--url", help="Also measure /api/cohort/users on a running server, e.g. http://localhost:8000"
+    )
+    args = parser.parse_args()
+
+    report("cached pages", bench_in_process(args.requests, 0))
+    report("one write per 100 requests", bench_in_process(args.requests, 100))
+    report("one write per 10 requests", bench_in_process(args.requests, 10))
+    if args.url:
+        report("HTTP round trip", bench_http(args.url, min(args.requests, 5000)))
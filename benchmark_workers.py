@@ -0,0 +1,76 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+
+def wait_until_ready(base_url, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/health/ready", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError("Server did not become ready in time.")
+
+
+def run_load(base_url, params, concurrency, duration):
+    # Each thread keeps one keep-alive session and loops until the deadline
+    deadline = time.time() + duration
+
+    def worker(_):
+        session = requests.Session()
+        done = 0
+        while time.time() < deadline:
+            session.get(f"{base_url}/api/user", params=params)
+            done += 1
+        return done
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return sum(pool.map(worker, range(concurrency)))
+
+
+def benchmark(workers, args):
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), PORT=str(args.port))
+    server = subprocess.Popen([sys.executable, "main.py"], env=env)
+    try:
+        wait_until_ready(base_url)
+        # Give every worker time to finish its own lifespan warm-up
+        time.sleep(args.settle)
+        requests_done = run_load(
+            base_url, {"email": args.email}, args.concurrency, args.duration
+        )
+        return requests_done / args.duration
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure /api/user throughput with 1..N uvicorn workers"
+    )
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--settle", type=float, default=3)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--email", default="testuser@example.com")
+    args = parser.parse_args()
+
+    baseline = None
+    workers = 1
+    while workers <= args.max_workers:
+        throughput = benchmark(workers, args)
+        baseline = baseline or throughput
+        print(
+            f"workers={workers:<3} {throughput:10.1f} req/s   "
+            f"scaling x{throughput / baseline:.2f}"
+        )
+        workers *= 2
@@ -0,0 +1,153 @@
+import argparse
+import threading
+import time
+import uuid
+import requests
+
+BASE_URL = "http://localhost:8000"
+
+
+def make_batch(size):
+    return {
+        "data": [
+            {
+                "cookie": f"load-{uuid.uuid4().hex}",
+                "email": f"load-{uuid.uuid4().hex[:12]}@example.com",
+                "phone_number": "+1000000000",
+                "location": {"state": "Texas", "country": "USA", "city": "Austin"},
+                "demographics": {
+                    "age": 30,
+                    "gender": "Female",
+                    "income": "$70,000-$89,999",
+                    "education": "Bachelor's",
+                },
+                "interests": ["travel", "photography"],
+            }
+            for _ in range(size)
+        ]
+    }
+
+
+def read_rss_mb(pid):
+    # Resident memory of the server process (same host, Linux only)
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+def probe_user_latency(stop, latencies, email):
+    session = requests.Session()
+    while not stop.is_set():
+        start = time.perf_counter()
+        session.get(f"{BASE_URL}/api/user", params={"email": email})
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.05)
+
+
+def flood_ingest(stop, statuses, batch_size):
+    session = requests.Session()
+    while not stop.is_set():
+        # A fresh batch every time: repeated content would be deduplicated and
+        # never reach the pipeline
+        response = session.post(
+            f"{BASE_URL}/api/ingest",
+            json=make_batch(batch_size),
+            headers={"X-Ingest-Priority": "bulk"},
+        )
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if response.status_code == 429:
+            # Honour Retry-After, but keep the pressure on
+            time.sleep(min(float(response.headers.get("Retry-After", 1)), 1))
+
+
+def wait_until_idle(timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if not requests.get(f"{BASE_URL}/api/metrics").json().get("ingest.in_flight"):
+            return
+        time.sleep(0.5)
+    raise TimeoutError("Ingest pipeline did not drain")
+
+
+def check_same_identity(records):
+    # One batch where every record carries the same cookie but its own interest
+    # and email: lost updates or a duplicate profile show up as missing values.
+    cookie = f"same-{uuid.uuid4().hex}"
+    batch = make_batch(records)
+    for i, record in enumerate(batch["data"]):
+        record["cookie"] = cookie
+        record["interests"] = [f"interest-{i}"]
+    wait_until_idle()
+    response = requests.post(f"{BASE_URL}/api/ingest", json=batch)
+    response.raise_for_status()
+    wait_until_idle()
+
+    profile = requests.get(f"{BASE_URL}/api/user", params={"cookie": cookie}).json()
+    profile = profile["user_profile"]
+    missing_interests = {f"interest-{i}" for i in range(records)} - set(profile["interests"])
+    missing_emails = {r["email"] for r in batch["data"]} - set(profile["emails"])
+    print("---------- Same identity ----------")
+    print(f"records            {records} with cookie {cookie}")
+    print(f"missing interests  {len(missing_interests)}")
+    print(f"missing emails     {len(missing_emails)}")
+    assert not missing_interests and not missing_emails, "Concurrent merges lost updates"
+
+
+def measure(label, pid, seconds, email, flooders=0, batch_size=500):
+    stop = threading.Event()
+    latencies, statuses, rss = [], {}, []
+    threads = [threading.Thread(target=probe_user_latency, args=(stop, latencies, email))]
+    threads += [
+        threading.Thread(target=flood_ingest, args=(stop, statuses, batch_size))
+        for _ in range(flooders)
+    ]
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        rss.append(read_rss_mb(pid))
+        time.sleep(1)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    metrics = requests.get(f"{BASE_URL}/api/metrics").json()
+    print(f"---------- {label} ----------")
+    print(
+        f"/api/user latency  p50 {percentile(latencies, 0.5):7.1f} ms  "
+        f"p99 {percentile(latencies, 0.99):7.1f} ms  ({len(latencies)} requests)"
+    )
+    print(f"server RSS         min {min(rss):7.1f} MB  max {max(rss):7.1f} MB")
+    print(f"ingest statuses    {statuses}")
+    print(f"in flight          {metrics.get('ingest.in_flight')}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Overload /api/ingest and watch memory and /api/user latency"
+    )
+    parser.add_argument("--seconds", type=int, default=30)
+    parser.add_argument("--flooders", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--email", default="testuser@example.com")
+    parser.add_argument("--same-identity-records", type=int, default=20)
+    args = parser.parse_args()
+
+    pid = requests.get(f"{BASE_URL}/health/ready").json()["pid"]
+    check_same_identity(args.same_identity_records)
+    measure("Baseline (idle pipeline)", pid, 10, args.email)
+    measure(
+        "Overloaded pipeline",
+        pid,
+        args.seconds,
+        args.email,
+        flooders=args.flooders,
+        batch_size=args.batch_size,
+    )
@@ -1,49 +1,327 @@
-from fastapi import FastAPI, BackgroundTasks, Request, HTTPException, Query
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+# Load .env before importing the services, some of which read settings at import time
+load_dotenv()
+
+from fastapi import FastAPI, Header, Request, Response, HTTPException, Query
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional, Dict, Any
 from services.mongo_service import *
+from services.cohort_service import ensure_cohort_indexes, fetch_cohort_page
+from services.dedup_service import (
+    KEY_ACCEPTED,
+    accept_idempotency_key,
+    claim_idempotency_key,
+    ensure_dedup_indexes,
+    filter_new_records,
+    forget_hashes,
+    idempotency_key_status,
+    release_idempotency_key,
+)
+from services.lookalike_service import get_lookalike_index, reload_lookalike_index
+from services.audience_service import get_audience_index, reload_audience_index
+from services.columnar_service import get_profile_store, load_profile_store
+from services.leaderboard_service import (
+    LEADERBOARD_REFRESH_SECONDS,
+    get_leaderboard,
+    refresh_leaderboard_periodically,
+)
 from utils.data_models import *
 from utils.data_handling import process_and_segment_user
 from utils.data_handling import flatten_dict
-from dotenv import load_dotenv
+from utils.ingest_coalescer import IngestCoalescer
+from utils.ingest_pipeline import IngestPipeline, LANES
+from utils import metrics
+from utils import profiler
+from utils.profiler import ProfilingMiddleware, current_profile
+
+# Admission control: largest accepted batch, records allowed in flight and the
+# number of records processed concurrently in the background.
+INGEST_MAX_BATCH_SIZE = int(os.getenv("INGEST_MAX_BATCH_SIZE", "1000"))
+INGEST_MAX_IN_FLIGHT = int(os.getenv("INGEST_MAX_IN_FLIGHT", "10000"))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "8"))
+# How long shutdown waits for queued records before dropping them
+INGEST_SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("INGEST_SHUTDOWN_TIMEOUT_SECONDS", "30"))
+ingest_pipeline = IngestPipeline(
+    process_and_segment_user, INGEST_MAX_IN_FLIGHT, INGEST_CONCURRENCY
+)
+
+# Records of the same identity arriving within this window are folded into one
+# merge + segmentation; 0 processes every record on its own.
+INGEST_COALESCE_WINDOW_SECONDS = float(os.getenv("INGEST_COALESCE_WINDOW_SECONDS", "0"))
+ingest_coalescer = (
+    IngestCoalescer(INGEST_COALESCE_WINDOW_SECONDS, ingest_pipeline.submit)
+    if INGEST_COALESCE_WINDOW_SECONDS > 0
+    else None
+)
+
+# The lookalike, audience and columnar indexes live in each worker process and
+# only see segmentations that worker ran itself; with several workers they are
+# rebuilt from MongoDB on this interval (0 disables the rebuild).
+INDEX_REFRESH_SECONDS = float(
+    os.getenv(
+        "INDEX_REFRESH_SECONDS",
+        "60" if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else "0",
+    )
+)
+
+
+def reload_in_memory_indexes():
+    load_profile_store()
+    reload_lookalike_index()
+    reload_audience_index()
+
+
+async def refresh_indexes_periodically():
+    # Rebuilds run in a thread; requests keep using the old indexes until swapped
+    while True:
+        await asyncio.sleep(INDEX_REFRESH_SECONDS)
+        try:
+            await asyncio.to_thread(reload_in_memory_indexes)
+        except Exception as e:
+            print(f"Failed to refresh in-memory indexes: {e}")
 
-load_dotenv()
 
 # ---------------------- FastAPI App ----------------------
 
-app = FastAPI(title="Customer Data Platform API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in every worker process after fork: each worker opens its own
+    # MongoDB client and pool, and only reports ready once warmed up.
+    app.state.ready = False
+    warm_up_mongo()
+    ensure_indexes()
+    ensure_cohort_indexes()
+    ensure_dedup_indexes()
+    # Columnar snapshot for audience counts; kept fresh by the merge path
+    load_profile_store()
+    get_lookalike_index()
+    get_audience_index()
+    get_leaderboard()
+    leaderboard_refresh = (
+        asyncio.create_task(refresh_leaderboard_periodically())
+        if LEADERBOARD_REFRESH_SECONDS > 0
+        else None
+    )
+    index_refresh = (
+        asyncio.create_task(refresh_indexes_periodically())
+        if INDEX_REFRESH_SECONDS > 0
+        else None
+    )
+    await ingest_pipeline.start()
+    app.state.ready = True
+    yield
+    app.state.ready = False
+    if leaderboard_refresh:
+        leaderboard_refresh.cancel()
+    if index_refresh:
+        index_refresh.cancel()
+    if ingest_coalescer:
+        ingest_coalescer.flush_all()
+    await ingest_pipeline.stop(INGEST_SHUTDOWN_TIMEOUT_SECONDS)
+    close_mongo_connection()
+
+
+app = FastAPI(title="Customer Data Platform API", lifespan=lifespan)
+app.add_middleware(ProfilingMiddleware)
+
+
+@app.get("/health/ready")
+async def readiness(response: Response):
+    if not getattr(app.state, "ready", False):
+        response.status_code = 503
+        return {"status": "starting", "pid": os.getpid()}
+    return {"status": "ready", "pid": os.getpid()}
+
+
+@app.get("/api/metrics")
+async def get_metrics():
+    return metrics.snapshot()
+
+
+# Profiling Debug Endpoints
+
+
+def check_profile_token(token: Optional[str]):
+    # Profiles expose code paths and timings: require the profiling token
+    if not profiler.token_matches(token):
+        raise HTTPException(status_code=404, detail="Not found.")
+
+
+@app.get("/debug/profiles")
+async def list_request_profiles(
+    token: Optional[str] = Header(None, alias="X-Profile-Token")
+):
+    check_profile_token(token)
+    return {"profiles": profiler.list_profiles()}
+
+
+@app.get("/debug/profiles/{profile_id}")
+async def get_request_profile(
+    profile_id: str,
+    output: str = Query("speedscope", alias="format"),
+    token: Optional[str] = Header(None, alias="X-Profile-Token"),
+):
+    check_profile_token(token)
+    if output not in ("speedscope", "collapsed"):
+        raise HTTPException(
+            status_code=400, detail="format must be 'speedscope' or 'collapsed'."
+        )
+    profile = profiler.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    if output == "collapsed":
+        return PlainTextResponse(profile.collapsed())
+    return profile.speedscope()
 
 
 # Background Task Placeholder
 
 
+def idempotency_replay_response(status, records):
+    """
+    Answers a batch whose Idempotency-Key is already known.
+
+    Returns:
+        IngestResponse or None: The duplicate response for an accepted batch,
+        or None for an unknown key.
+
+    Raises:
+        HTTPException: 409 while the first request with the key is still pending.
+    """
+    if status is None:
+        return None
+    if status != KEY_ACCEPTED:
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is still being processed.",
+            headers={"Retry-After": "1"},
+        )
+    metrics.increment("ingest.records_deduplicated", records)
+    return IngestResponse(
+        status="success",
+        records_processed=0,
+        records_deduplicated=records,
+        errors=[],
+    )
+
+
 @app.post("/api/ingest", response_model=IngestResponse)
-async def ingest_user_data(payload: IngestRequest, background_tasks: BackgroundTasks):
+async def ingest_user_data(
+    payload: IngestRequest,
+    priority: str = Header("interactive", alias="X-Ingest-Priority"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    if len(payload.data) > INGEST_MAX_BATCH_SIZE:
+        metrics.increment("ingest.rejected.batch_too_large")
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: at most {INGEST_MAX_BATCH_SIZE} records per request.",
+        )
+    lane = LANES.get(priority.lower())
+    if lane is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"X-Ingest-Priority must be one of: {', '.join(LANES)}.",
+        )
+    # Replayed batches are answered before admission, so a retry of an accepted
+    # batch is not rejected as saturated (read-only; the key is claimed below)
+    if idempotency_key:
+        replay = idempotency_replay_response(
+            idempotency_key_status(idempotency_key), len(payload.data)
+        )
+        if replay:
+            return replay
+    # Reject up front instead of queueing unbounded background work
+    if not ingest_pipeline.try_admit(len(payload.data), lane):
+        raise HTTPException(
+            status_code=429,
+            detail="Ingest pipeline is saturated, retry later.",
+            headers={"Retry-After": str(ingest_pipeline.retry_after())},
+        )
+
+    admitted = len(payload.data)
+    claimed_key = None
+    new_hashes = []
     try:
         users_data = [user.dict() for user in payload.data]
 
-        # ✅ 1. Bulk insert raw data (no change)
-        insert_into_mongo("raw_data", users_data)
+        # ✅ 1. Skip batches and records already accepted within the dedup window
+        if idempotency_key:
+            if not claim_idempotency_key(idempotency_key):
+                # Claimed by a concurrent request since the lookup above
+                ingest_pipeline.release(admitted)
+                admitted = 0
+                status = idempotency_key_status(idempotency_key)
+                return idempotency_replay_response(status or KEY_PENDING, len(users_data))
+            claimed_key = idempotency_key
+        new_users, new_hashes = filter_new_records(users_data)
+        deduplicated = len(users_data) - len(new_users)
+        ingest_pipeline.release(deduplicated)
+        admitted -= deduplicated
+        metrics.increment("ingest.records_deduplicated", deduplicated)
 
-        # ✅ 2. Process each user in the background (merging + segmentation together)
-        for user in users_data:
-            background_tasks.add_task(process_and_segment_user, user)
+        # ✅ 2. Bulk insert raw data
+        if new_users:
+            insert_into_mongo("raw_data", new_users)
+
+        # ✅ 3. Process each user in the background (merging + segmentation together)
+        metrics.increment("ingest.records_received", len(new_users))
+        profile = current_profile()
+        for user in new_users:
+            if profile:
+                # Background processing of the record joins this request's profile
+                profile.begin_part()
+            if ingest_coalescer:
+                ingest_coalescer.add(user, lane, profile)
+            else:
+                ingest_pipeline.submit(user, lane, profiles=[profile] if profile else ())
+            admitted -= 1
+
+        if claimed_key:
+            try:
+                accept_idempotency_key(claimed_key)
+            except Exception as e:
+                # The records are already queued: keep them, the key turns stale
+                # and the record hashes still deduplicate a retry
+                print(f"Failed to accept idempotency key: {e}")
+            claimed_key = None
 
         return IngestResponse(
-            status="success", records_processed=len(users_data), errors=[]
+            status="success",
+            records_processed=len(new_users),
+            records_deduplicated=deduplicated,
+            errors=[],
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
+        # Free the capacity reserved for records that never reached the pipeline,
+        # and forget the batch so the partner's retry is not treated as a duplicate
+        ingest_pipeline.release(admitted)
+        try:
+            if claimed_key:
+                release_idempotency_key(claimed_key)
+            forget_hashes(new_hashes)
+        except Exception as cleanup_error:
+            print(f"Failed to reset ingest dedup state: {cleanup_error}")
         return IngestResponse(status="failure", records_processed=0, errors=[str(e)])
 
 
 # Get User Endpoint
 
 
-@app.get("/api/user", response_model=UserProfileResponse)
-async def get_user(
-    cookie: Optional[str] = Query(None), email: Optional[EmailStr] = Query(None)
-):
+def find_user_profile(cookie: Optional[str], email: Optional[str]) -> dict:
+    """
+    Looks up a single user profile by cookie and/or email.
+    Raises HTTPException (400/404) when no identity is given or no user matches.
+    """
     if not cookie and not email:
         raise HTTPException(
             status_code=400, detail="Either cookie or email must be provided."
@@ -67,10 +345,44 @@ async def get_user(
 
     user = results[0]
     user.pop("_id", None)
+    return user
+
+
+@app.get("/api/user", response_model=UserProfileResponse)
+async def get_user(
+    cookie: Optional[str] = Query(None), email: Optional[EmailStr] = Query(None)
+):
+    user = find_user_profile(cookie, email)
 
     return UserProfileResponse(user_profile=user)
 
 
+# Get Lookalike Users Endpoint
+
+
+@app.get("/api/user/lookalikes", response_model=LookalikesResponse)
+def get_lookalike_users(
+    cookie: Optional[str] = Query(None),
+    email: Optional[EmailStr] = Query(None),
+    limit: int = Query(10, ge=1, le=100),
+):
+    user = find_user_profile(cookie, email)
+    user_id = user["user_id"]
+
+    # Cosine similarity over cohort scores + hashed interests, served from memory.
+    # A plain def handler: FastAPI runs it in the threadpool, so the vector scan
+    # does not block the event loop.
+    matches = get_lookalike_index().top_k(user_id, limit)
+    if matches is None:
+        raise HTTPException(status_code=404, detail="User has not been segmented yet.")
+
+    users = [
+        {"user_id": match_id, "email": match_email, "similarity_score": round(score, 4)}
+        for match_id, match_email, score in matches
+    ]
+    return LookalikesResponse(user_id=user_id, users=users)
+
+
 # Get Users by Cohort Endpoint
 
 
@@ -80,31 +392,70 @@ async def get_users_from_cohort(
 ):
     if not cohort:
         raise HTTPException(status_code=400, detail="Cohort must be provided.")
+    # Hot cohorts: first pages come pre-serialized from the in-memory leaderboard
+    body = get_leaderboard().page_bytes(cohort, offset, limit)
+    if body is not None:
+        return Response(content=body, media_type="application/json")
+
     # 1. Lowercase the cohort
     cohort_lower = cohort.lower()
-    # 2. Query the 'cohort_data' collection for the cohort
-    query = {"cohort": cohort_lower}
-    # 3. Only return email and similarity_score, 4. Order by similarity_score desc, updated_at desc, email asc
-    sort = [("similarity_score", -1), ("updated_at", -1), ("email", 1)]
-
-    # Direct pymongo usage for projection and pagination
-
-    client = connect_to_mongo()
-    db = client.get_default_database()
-    collection = db["cohort_data"]
-    cursor = (
-        collection.find(query, {"email": 1, "similarity_score": 1, "_id": 0})
-        .sort(sort)
-        .skip(offset)
-        .limit(limit)
-    )
+    # 2. Read one page of the cohort, ordered by similarity_score desc, updated_at desc, email asc
+    page = fetch_cohort_page(cohort_lower, offset, limit)
 
     users = []
-    for doc in cursor:
-        email = doc.get("email", "unknown@example.com")
-        similarity_score = doc.get("similarity_score", 0)
-        # 5. Divide similarity_score by 100 and return as float
-        similarity_score = float(similarity_score) / 100.0
-        users.append({"email": email, "similarity_score": similarity_score})
+    for entry in page:
+        # 3. Divide similarity_score by 100 and return as float
+        similarity_score = float(entry["similarity_score"]) / 100.0
+        users.append({"email": entry["email"], "similarity_score": similarity_score})
 
     return SimilarUsersResponse(cohort=cohort, users=users)
+
+
+# Audience Query Endpoint
+
+
+@app.post("/api/audience/query", response_model=AudienceQueryResponse)
+def query_audience(payload: AudienceQueryRequest):
+    # Boolean cohort expressions evaluated over in-memory bitmaps; a plain def
+    # handler, so FastAPI runs it in the threadpool off the event loop
+    limit = payload.limit if payload.include_members else 0
+    try:
+        count, members = get_audience_index().query(
+            payload.expression, offset=payload.offset, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    members = [
+        {"user_id": user_id, "emails": emails} for user_id, emails in members
+    ]
+    return AudienceQueryResponse(count=count, members=members)
+
+
+# Audience Count Endpoint
+
+
+@app.post("/api/audience/count", response_model=AudienceCountResponse)
+def count_audience(payload: AudienceCountRequest):
+    # Vectorized filter/group-by over the columnar profile snapshot; a plain def
+    # handler, so FastAPI runs it in the threadpool off the event loop
+    try:
+        count, groups = get_profile_store().count(
+            payload.filters.model_dump(exclude_none=True), payload.group_by
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return AudienceCountResponse(count=count, groups=groups)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # Multi-worker mode: WEB_CONCURRENCY worker processes, each running the lifespan above
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
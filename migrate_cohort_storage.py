@@ -0,0 +1,90 @@
+import argparse
+from datetime import datetime
+from bson.binary import Binary
+from dotenv import load_dotenv
+from pymongo import DeleteMany, InsertOne, UpdateOne
+
+load_dotenv()
+
+from services.mongo_service import connect_to_mongo
+from services.cohort_service import ensure_cohort_indexes, pack_scores, rank_entries
+
+
+def migrate(batch_size, drop_old):
+    """
+    Converts 'cohort_data' (one document per email x cohort) into 'cohort_vectors'
+    (one packed score vector per user) and the slim 'cohort_rank' sort index.
+    Safe to re-run: vectors are upserted and rank entries rebuilt per user.
+    """
+    db = connect_to_mongo().get_default_database()
+    ensure_cohort_indexes()
+
+    # Group the old documents per user, keeping the newest update time
+    users = {}
+    for doc in db["cohort_data"].find(
+        {}, {"user_id": 1, "email": 1, "cohort": 1, "similarity_score": 1, "updated_at": 1}
+    ):
+        user = users.setdefault(
+            doc["user_id"], {"emails": [], "scores": {}, "updated_at": None}
+        )
+        if doc["email"] not in user["emails"]:
+            user["emails"].append(doc["email"])
+        user["scores"][doc["cohort"]] = int(doc["similarity_score"])
+        updated_at = doc.get("updated_at")
+        if updated_at and (user["updated_at"] is None or updated_at > user["updated_at"]):
+            user["updated_at"] = updated_at
+
+    vector_ops, rank_ops, migrated = [], [], 0
+    for user_id, user in users.items():
+        updated_at = user["updated_at"] or datetime.now()
+        vector_ops.append(
+            UpdateOne(
+                {"_id": user_id},
+                {
+                    "$set": {
+                        "emails": user["emails"],
+                        "scores": Binary(pack_scores(user["scores"])),
+                        "updated_at": updated_at,
+                    },
+                    "$setOnInsert": {"created_at": updated_at},
+                },
+                upsert=True,
+            )
+        )
+        rank_ops.append(DeleteMany({"u": user_id}))
+        rank_ops.extend(
+            InsertOne(entry)
+            for entry in rank_entries(user_id, user["emails"], user["scores"], updated_at)
+        )
+        migrated += 1
+        if len(vector_ops) >= batch_size:
+            db["cohort_vectors"].bulk_write(vector_ops, ordered=False)
+            if rank_ops:
+                # Ordered, so each user's delete runs before its inserts
+                db["cohort_rank"].bulk_write(rank_ops)
+            vector_ops, rank_ops = [], []
+            print(f"Migrated {migrated}/{len(users)} users")
+
+    if vector_ops:
+        db["cohort_vectors"].bulk_write(vector_ops, ordered=False)
+    if rank_ops:
+        db["cohort_rank"].bulk_write(rank_ops)
+    print(f"Migrated {migrated} users into 'cohort_vectors' and 'cohort_rank'")
+
+    if drop_old:
+        db["cohort_data"].drop()
+        print("Dropped 'cohort_data'")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Migrate cohort_data to the compact per-user vector layout"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--drop-old",
+        action="store_true",
+        help="Drop 'cohort_data' once migrated (only after switching COHORT_STORAGE=vectors)",
+    )
+    args = parser.parse_args()
+    migrate(args.batch_size, args.drop_old)
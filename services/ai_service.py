@@ -2,52 +2,131 @@ import json
 from utils import segmentation_prompt
 import re
 import ast
-from openai import OpenAI
+from openai import OpenAI, BadRequestError
 import os
+from utils import metrics
+
+
+# JSON schema for structured outputs; the model can only emit the allowed cohorts
+SEGMENTATION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "cohort_assignment",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "cohorts": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "cohort": {
+                                "type": "string",
+                                "enum": segmentation_prompt.cohorts,
+                            },
+                            "similarity_score": {"type": "number"},
+                        },
+                        "required": ["cohort", "similarity_score"],
+                        "additionalProperties": False,
+                    },
+                }
+            },
+            "required": ["cohorts"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# Set to false when the model/endpoint rejects json_schema response formats
+_structured_output = os.getenv("OPENAI_STRUCTURED_OUTPUT", "true").lower() == "true"
+
+# A flat JSON/Python object, i.e. one {cohort, similarity_score} item
+_ITEM_PATTERN = re.compile(r"\{[^{}]*\}")
+
+
+def iter_segment_items(chunks):
+    """
+    Incrementally extracts {cohort, similarity_score} items from model output.
 
+    Works on a stream of text chunks and tolerates anything around the items:
+    markdown fences, prose, a wrapping object, single-quoted Python literals or
+    output truncated in the middle of an item (the incomplete item is dropped).
 
-def clean_response(response_str):
-    """
-    Cleans a model response string by removing markdown/code block artifacts.
+    Args:
+        chunks (iterable of str): The response text, in one or more pieces.
 
-    Specifically removes:
-    - Triple backticks and optional language identifiers (e.g., ```python)
-    - Leading/trailing whitespace and newlines
+    Yields:
+        dict: Each parsed item that has 'cohort' and 'similarity_score' keys.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        end = 0
+        for match in _ITEM_PATTERN.finditer(buffer):
+            end = match.end()
+            item = None
+            try:
+                item = json.loads(match.group())
+            except ValueError:
+                try:
+                    item = ast.literal_eval(match.group())
+                except (ValueError, SyntaxError):
+                    pass
+            if (
+                isinstance(item, dict)
+                and "cohort" in item
+                and "similarity_score" in item
+            ):
+                yield item
+        buffer = buffer[end:]
+
+
+def normalize_segments(items):
+    """
+    Keeps only usable segments: known cohort names (case-insensitive), numeric
+    scores clamped to [0, 1] and rounded to 2 decimals, first occurrence per cohort.
 
     Args:
-        response_str (str): The raw response string from the model.
+        items (iterable of dict): Raw items from iter_segment_items.
 
     Returns:
-        object: The parsed Python object if it's a valid literal (like dict, list, or quoted string),
-                otherwise returns the cleaned string as-is.
+        tuple: (segments, dropped) where dropped counts the rejected items.
     """
-    cleaned = re.sub(
-        r"^```(?:python|json)?\s*|\s*```$",
-        "",
-        response_str.strip(),
-        flags=re.IGNORECASE | re.MULTILINE,
-    ).strip()
-
-    try:
-        # Try parsing it as a Python literal
-        return ast.literal_eval(cleaned)
-    except (ValueError, SyntaxError):
-        # If it's not a valid Python literal, return as plain string
-        return cleaned
-
-
-def ai_call(system_prompt: str, user_prompt: str) -> str:
+    allowed = set(segmentation_prompt.cohorts)
+    segments = []
+    seen = set()
+    dropped = 0
+    for item in items:
+        cohort = str(item.get("cohort", "")).strip().lower()
+        try:
+            score = float(item.get("similarity_score"))
+        except (TypeError, ValueError):
+            score = None
+        if cohort not in allowed or cohort in seen or score is None or score != score:
+            dropped += 1
+            continue
+        seen.add(cohort)
+        segments.append(
+            {"cohort": cohort, "similarity_score": round(min(max(score, 0.0), 1.0), 2)}
+        )
+    return segments, dropped
+
+
+def ai_call(system_prompt: str, user_prompt: str, response_format=None):
     """
     Calls the OpenAI chat completion API with the given system and user prompts.
 
     Args:
         system_prompt (str): The system prompt to set the assistant's behavior.
         user_prompt (str): The user's input prompt.
+        response_format (dict, optional): Structured output format to request.
 
     Returns:
-        str: The cleaned response from the model.
+        tuple: (reply, total_tokens) with the raw response text and the tokens used.
     """
     client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    kwargs = {"response_format": response_format} if response_format else {}
     response = client.chat.completions.create(
         model="gpt-4.1-nano-2025-04-14",
         messages=[
@@ -56,41 +135,71 @@ def ai_call(system_prompt: str, user_prompt: str) -> str:
         ],
         temperature=0.2,
         max_tokens=500,
+        **kwargs,
     )
 
-    reply = response.choices[0].message.content.strip()
+    reply = (response.choices[0].message.content or "").strip()
+    total_tokens = response.usage.total_tokens if response.usage else 0
+    metrics.increment("ai.tokens.total", total_tokens)
 
-    return clean_response(reply)
+    return reply, total_tokens
+
+
+def _is_response_format_error(error):
+    # Only a rejected response_format means structured outputs are unsupported;
+    # other bad requests (content filter, prompt too long) must not disable them.
+    if getattr(error, "param", None) == "response_format":
+        return True
+    message = str(getattr(error, "message", error)).lower()
+    return "response_format" in message or "json_schema" in message
 
 
 def get_cohorts_from_interests(user_id, user_interests) -> list:
     """
-    Assigns user interests to cohorts using the OpenAI GPT-4o model.
+    Assigns user interests to cohorts using the OpenAI GPT model.
+
+    Requests schema-constrained JSON when the API supports it, then salvages every
+    valid item from the reply instead of rejecting the whole response. Only
+    retries (up to 5 calls) when no valid cohort could be recovered.
 
     Args:
         user_id (str or int): The unique identifier for the user.
         user_interests (list): List of user interests (strings).
 
     Returns:
-        list: List of dictionaries, each with keys 'cohort' and 'score'.
-              Returns an empty list if the correct structure is not obtained after 5 attempts.
+        list: List of dictionaries, each with keys 'cohort' and 'similarity_score'.
+              Returns an empty list if no valid cohort is obtained after 5 attempts.
     """
-    user_prompt = segmentation_prompt.user_prompt.format(interests=user_interests)
-    for _ in range(5):
-        segments = ai_call(segmentation_prompt.system_prompt, user_prompt)
-        # Check if segments is a list of dicts with 'cohort' and 'score' keys
-        if isinstance(segments, list) and all(
-            isinstance(item, dict) and "cohort" in item and "similarity_score" in item
-            for item in segments
-        ):
-            unique_cohorts = set()
-            unique_segments = []
-            for item in segments:
-                cohort = item["cohort"]
-                if cohort not in unique_cohorts:
-                    unique_cohorts.add(cohort)
-                    unique_segments.append(item)
-            return unique_segments
+    global _structured_output
+    user_prompt = segmentation_prompt.user_prompt.format(
+        interests=user_interests, cohorts=json.dumps(segmentation_prompt.cohorts)
+    )
+    for attempt in range(5):
+        if attempt:
+            metrics.increment("ai.segmentation.retries")
+        metrics.increment("ai.segmentation.calls")
+        try:
+            reply, tokens = ai_call(
+                segmentation_prompt.system_prompt,
+                user_prompt,
+                SEGMENTATION_RESPONSE_FORMAT if _structured_output else None,
+            )
+        except BadRequestError as e:
+            if not _structured_output or not _is_response_format_error(e):
+                raise
+            # Model or endpoint without json_schema support: use the prompt only
+            print("Structured outputs not supported, falling back to plain JSON")
+            _structured_output = False
+            metrics.increment("ai.segmentation.calls")
+            reply, tokens = ai_call(segmentation_prompt.system_prompt, user_prompt)
+
+        segments, dropped = normalize_segments(iter_segment_items([reply]))
+        metrics.increment("ai.segmentation.items_dropped", dropped)
+        if segments:
+            return segments
+        metrics.increment("ai.tokens.wasted", tokens)
+
+    metrics.increment("ai.segmentation.failures")
     print(f"Having issue in cohorts for user id: {user_id}")
     return []
 
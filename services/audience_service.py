@@ -0,0 +1,240 @@
+import threading
+import numpy as np
+from services.cohort_service import fetch_user_cohort_scores
+from utils.segmentation_prompt import cohorts as COHORTS
+
+_COHORT_POSITIONS = {cohort: i for i, cohort in enumerate(COHORTS)}
+
+# Limits on audience expressions, so a request cannot nest or fan out without bound
+MAX_EXPRESSION_DEPTH = 32
+MAX_EXPRESSION_LEAVES = 256
+
+# Number of set bits in every possible byte, used to count packed bitmaps.
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class AudienceIndex:
+    """
+    In-memory bitmap index for boolean audience queries across cohorts.
+
+    Every user gets a dense ordinal. Each cohort has a packed membership bitmap
+    (one bit per ordinal) and a uint8 score column (similarity_score 0-100), so
+    AND/OR/NOT expressions and score thresholds evaluate as vectorized byte
+    operations without touching MongoDB.
+    """
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self._allocate(capacity)
+        self._ordinals = {}  # user_id -> ordinal
+        self._user_ids = []  # ordinal -> user_id
+        self._emails = []  # ordinal -> emails
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._user_ids)
+
+    def _allocate(self, capacity):
+        self._capacity = capacity
+        self._members = np.zeros((len(COHORTS), capacity // 8), dtype=np.uint8)
+        self._scores = np.zeros((len(COHORTS), capacity), dtype=np.uint8)
+        self._live = np.zeros(capacity // 8, dtype=np.uint8)
+
+    def _grow(self):
+        members, scores, live = self._members, self._scores, self._live
+        self._allocate(self._capacity * 2)
+        self._members[:, : members.shape[1]] = members
+        self._scores[:, : scores.shape[1]] = scores
+        self._live[: live.shape[0]] = live
+
+    def _set_user(self, user_id, emails, cohort_scores):
+        ordinal = self._ordinals.get(user_id)
+        if ordinal is None:
+            ordinal = len(self._user_ids)
+            if ordinal == self._capacity:
+                self._grow()
+            self._ordinals[user_id] = ordinal
+            self._user_ids.append(user_id)
+            self._emails.append(list(emails))
+        else:
+            self._emails[ordinal] = list(emails)
+
+        byte, bit = ordinal >> 3, np.uint8(1 << (ordinal & 7))
+        self._live[byte] |= bit
+        self._members[:, byte] &= ~bit
+        self._scores[:, ordinal] = 0
+        for cohort, score in cohort_scores.items():
+            position = _COHORT_POSITIONS.get(cohort)
+            if position is not None:
+                self._members[position, byte] |= bit
+                self._scores[position, ordinal] = min(max(int(score), 0), 100)
+
+    def set_user(self, user_id, emails, cohort_scores):
+        """
+        Replaces the cohort memberships of a single user.
+
+        Args:
+            user_id (str): The user's id.
+            emails (list): The user's emails, returned with paged members.
+            cohort_scores (dict): Mapping of cohort name to stored score (0-100).
+        """
+        with self._lock:
+            self._set_user(user_id, emails, cohort_scores)
+
+    def bulk_load(self, users):
+        """
+        Replaces the index contents with the given users.
+
+        Args:
+            users (iterable): (user_id, emails, cohort_scores) tuples.
+        """
+        with self._lock:
+            self._allocate(self._capacity)
+            self._ordinals = {}
+            self._user_ids = []
+            self._emails = []
+            for user_id, emails, cohort_scores in users:
+                self._set_user(user_id, emails, cohort_scores)
+            self.loaded = True
+
+    @staticmethod
+    def _count_leaves(expression, depth=1):
+        # Walks the expression shape only, before any bitmap work is done
+        if depth > MAX_EXPRESSION_DEPTH:
+            raise ValueError(
+                f"Expression is nested deeper than {MAX_EXPRESSION_DEPTH} levels."
+            )
+        if not isinstance(expression, dict) or "cohort" in expression:
+            return 1  # leaf; its contents are checked by _evaluate
+        leaves = 0
+        for operand in expression.values():
+            children = operand if isinstance(operand, list) else [operand]
+            for child in children:
+                leaves += AudienceIndex._count_leaves(child, depth + 1)
+                if leaves > MAX_EXPRESSION_LEAVES:
+                    raise ValueError(
+                        f"Expression has more than {MAX_EXPRESSION_LEAVES} cohort terms."
+                    )
+        return leaves
+
+    def _evaluate(self, expression):
+        if not isinstance(expression, dict) or len(expression) == 0:
+            raise ValueError("Each expression must be a non-empty object.")
+
+        if "cohort" in expression:
+            unknown = set(expression) - {"cohort", "min_score"}
+            if unknown:
+                raise ValueError(f"Unknown keys in cohort expression: {sorted(unknown)}")
+            cohort = str(expression["cohort"]).lower()
+            position = _COHORT_POSITIONS.get(cohort)
+            if position is None:
+                raise ValueError(f"Unknown cohort: {cohort}")
+            min_score = expression.get("min_score")
+            if min_score is None:
+                return self._members[position].copy()
+            if not isinstance(min_score, (int, float)) or not 0 <= min_score <= 1:
+                raise ValueError("min_score must be a number between 0 and 1.")
+            threshold = int(round(min_score * 100))
+            passing = np.packbits(self._scores[position] >= threshold, bitorder="little")
+            return passing & self._members[position]
+
+        if len(expression) != 1:
+            raise ValueError("Operator expressions must have exactly one key.")
+        operator, operand = next(iter(expression.items()))
+        if operator == "not":
+            return ~self._evaluate(operand) & self._live
+        if operator in ("and", "or"):
+            if not isinstance(operand, list) or not operand:
+                raise ValueError(f"'{operator}' expects a non-empty list.")
+            result = self._evaluate(operand[0])
+            for child in operand[1:]:
+                if operator == "and":
+                    result &= self._evaluate(child)
+                else:
+                    result |= self._evaluate(child)
+            return result
+        raise ValueError(f"Unknown operator: {operator}")
+
+    def query(self, expression, offset=0, limit=0):
+        """
+        Evaluates a boolean audience expression.
+
+        Expressions are nested objects:
+            {"cohort": "travel", "min_score": 0.5}
+            {"and": [expr, ...]}, {"or": [expr, ...]}, {"not": expr}
+
+        Args:
+            expression (dict): The audience expression.
+            offset (int): Number of matching users to skip when paging members.
+            limit (int): Number of members to return; 0 returns only the count.
+
+        Returns:
+            tuple: (count, members) where members is a list of (user_id, emails).
+
+        Raises:
+            ValueError: If the expression is malformed, nested deeper than
+                        MAX_EXPRESSION_DEPTH or has more than MAX_EXPRESSION_LEAVES terms.
+        """
+        self._count_leaves(expression)
+        with self._lock:
+            result = self._evaluate(expression)
+            count = int(_POPCOUNT[result].sum(dtype=np.int64))
+            members = []
+            if limit > 0 and offset < count:
+                ordinals = np.flatnonzero(np.unpackbits(result, bitorder="little"))
+                for ordinal in ordinals[offset : offset + limit]:
+                    members.append((self._user_ids[ordinal], self._emails[ordinal]))
+            return count, members
+
+
+# Global index shared by the API and the segmentation background tasks
+_audience_index = AudienceIndex()
+
+
+def get_audience_index():
+    """
+    Returns the global audience index, building it from MongoDB on first use.
+
+    Returns:
+        AudienceIndex: The loaded index.
+    """
+    if not _audience_index.loaded:
+        _audience_index.bulk_load(
+            (user_id, emails, scores)
+            for user_id, emails, _, scores in fetch_user_cohort_scores()
+        )
+        print(f"Loaded {len(_audience_index)} users into the audience index")
+    return _audience_index
+
+
+def reload_audience_index():
+    """
+    Rebuilds the audience bitmaps from MongoDB into a new index and swaps it in,
+    so queries keep being served from the old one while the new one loads.
+    Picks up segmentations made by other worker processes.
+    """
+    global _audience_index
+    index = AudienceIndex()
+    index.bulk_load(
+        (user_id, emails, scores)
+        for user_id, emails, _, scores in fetch_user_cohort_scores()
+    )
+    _audience_index = index
+
+
+def update_audience_index(user_id, emails, cohort_entries):
+    """
+    Refreshes a single user's cohort bitmaps after segmentation.
+    Does nothing until the index has been built; the initial build reads the latest data.
+
+    Args:
+        user_id (str): The segmented user's id.
+        emails (list): The user's emails.
+        cohort_entries (list): The cohort entries just saved for this user.
+    """
+    if not _audience_index.loaded:
+        return
+    cohort_scores = {
+        entry["cohort"]: entry["similarity_score"] for entry in cohort_entries
+    }
+    _audience_index.set_user(user_id, emails, cohort_scores)
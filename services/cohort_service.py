@@ -0,0 +1,243 @@
+import os
+from datetime import datetime
+from bson.binary import Binary
+from pymongo import ASCENDING, DESCENDING
+from services.mongo_service import connect_to_mongo, delete_from_mongo, insert_into_mongo
+from utils.segmentation_prompt import cohorts as COHORTS
+
+# Storage layout for cohort assignments:
+#   "documents" - one 'cohort_data' document per (email x cohort)
+#   "vectors"   - one 'cohort_vectors' document per user holding all 12 scores,
+#                 plus one slim 'cohort_rank' entry per (user x cohort) used to
+#                 page through a cohort
+COHORT_STORAGE = os.getenv("COHORT_STORAGE", "documents")
+
+# Byte stored in a packed score vector for cohorts the user is not in
+NOT_IN_COHORT = 255
+
+_COHORT_POSITIONS = {cohort: i for i, cohort in enumerate(COHORTS)}
+
+
+def _get_db():
+    db = connect_to_mongo().get_default_database()
+    if db is None:
+        raise ValueError(
+            "No default database specified in MONGO_URI. Please ensure your URI is in the format 'mongodb://host:port/defaultdb'."
+        )
+    return db
+
+
+def pack_scores(cohort_scores):
+    """
+    Packs cohort scores into a fixed 12-byte vector, one uint8 slot per cohort.
+
+    Args:
+        cohort_scores (dict): Mapping of cohort name to stored score (0-100).
+
+    Returns:
+        bytes: The packed vector; NOT_IN_COHORT marks cohorts without a score.
+    """
+    packed = bytearray([NOT_IN_COHORT] * len(COHORTS))
+    for cohort, score in cohort_scores.items():
+        position = _COHORT_POSITIONS.get(cohort)
+        if position is not None:
+            packed[position] = min(max(int(score), 0), 100)
+    return bytes(packed)
+
+
+def unpack_scores(packed):
+    """
+    Inverse of pack_scores.
+
+    Returns:
+        dict: Mapping of cohort name to stored score (0-100).
+    """
+    return {
+        COHORTS[position]: score
+        for position, score in enumerate(packed)
+        if score != NOT_IN_COHORT
+    }
+
+
+def rank_entries(user_id, emails, cohort_scores, updated_at):
+    """
+    Builds the slim 'cohort_rank' entries of a user: one per (user x cohort)
+    with short field names and only what sorting and paging a cohort need.
+    The user's emails are carried on the entry ('e', sorted) and expanded when
+    paging; 'f' holds the first one as a scalar tie-breaker for the sort index.
+    """
+    emails = sorted(set(emails))
+    if not emails:
+        return []
+    return [
+        {
+            "c": _COHORT_POSITIONS[cohort],
+            "s": score,
+            "t": updated_at,
+            "f": emails[0],
+            "e": emails,
+            "u": user_id,
+        }
+        for cohort, score in cohort_scores.items()
+        if cohort in _COHORT_POSITIONS
+    ]
+
+
+def ensure_cohort_indexes():
+    """
+    Creates the indexes used by the vector layout.
+    """
+    db = _get_db()
+    db["cohort_rank"].create_index(
+        [("c", ASCENDING), ("s", DESCENDING), ("t", DESCENDING), ("f", ASCENDING)]
+    )
+    db["cohort_rank"].create_index([("u", ASCENDING)])
+
+
+def save_user_cohorts(user_id, emails, cohort_entries, layout=None):
+    """
+    Replaces the stored cohort assignments of a user.
+
+    Args:
+        user_id (str): The segmented user's id.
+        emails (list): The user's emails; previous entries for them are replaced.
+        cohort_entries (list): One dict per (email x cohort) with 'user_id', 'email',
+                               'cohort' and integer 'similarity_score'.
+        layout (str, optional): "documents" or "vectors"; defaults to COHORT_STORAGE.
+
+    Returns:
+        int: Number of documents written.
+    """
+    layout = layout or COHORT_STORAGE
+
+    if layout == "documents":
+        for email in emails:
+            # Delete all cohort_data entries for this email before inserting new ones
+            delete_from_mongo("cohort_data", {"email": email})
+        if cohort_entries:
+            insert_into_mongo("cohort_data", cohort_entries)
+        return len(cohort_entries)
+
+    if layout != "vectors":
+        raise ValueError(f"Unknown cohort storage layout: {layout}")
+
+    db = _get_db()
+    now = datetime.now()
+    cohort_scores = {
+        entry["cohort"]: entry["similarity_score"] for entry in cohort_entries
+    }
+    db["cohort_vectors"].update_one(
+        {"_id": user_id},
+        {
+            "$set": {
+                "emails": list(emails),
+                "scores": Binary(pack_scores(cohort_scores)),
+                "updated_at": now,
+            },
+            "$setOnInsert": {"created_at": now},
+        },
+        upsert=True,
+    )
+    db["cohort_rank"].delete_many({"u": user_id})
+    entries = rank_entries(user_id, emails, cohort_scores, now)
+    if entries:
+        db["cohort_rank"].insert_many(entries, ordered=False)
+    return 1 + len(entries)
+
+
+def fetch_cohort_page(cohort, offset, limit, layout=None):
+    """
+    Returns one page of a cohort's members, ordered by similarity_score desc,
+    updated_at desc, email asc.
+
+    Args:
+        cohort (str): Lowercase cohort name.
+        offset (int): Number of entries to skip.
+        limit (int): Maximum number of entries to return.
+        layout (str, optional): "documents" or "vectors"; defaults to COHORT_STORAGE.
+
+    Returns:
+        list: Dicts with 'email', the stored integer 'similarity_score' (0-100)
+              and 'updated_at'.
+    """
+    layout = layout or COHORT_STORAGE
+    db = _get_db()
+
+    if layout == "vectors":
+        position = _COHORT_POSITIONS.get(cohort)
+        if position is None:
+            return []
+        # Walk the sort index per user, then expand each entry into its emails
+        # so offset and limit still count (email x cohort) rows.
+        cursor = db["cohort_rank"].aggregate(
+            [
+                {"$match": {"c": position}},
+                {"$sort": {"s": -1, "t": -1, "f": 1}},
+                {"$project": {"e": 1, "s": 1, "t": 1, "_id": 0}},
+                {"$unwind": "$e"},
+                {"$skip": offset},
+                {"$limit": limit},
+            ]
+        )
+        return [
+            {"email": doc["e"], "similarity_score": doc["s"], "updated_at": doc.get("t")}
+            for doc in cursor
+        ]
+
+    cursor = (
+        db["cohort_data"]
+        .find(
+            {"cohort": cohort},
+            {"email": 1, "similarity_score": 1, "updated_at": 1, "_id": 0},
+        )
+        .sort([("similarity_score", -1), ("updated_at", -1), ("email", 1)])
+        .skip(offset)
+        .limit(limit)
+    )
+    return [
+        {
+            "email": doc.get("email", "unknown@example.com"),
+            "similarity_score": doc.get("similarity_score", 0),
+            "updated_at": doc.get("updated_at"),
+        }
+        for doc in cursor
+    ]
+
+
+def fetch_user_cohort_scores(layout=None):
+    """
+    Reads every user profile together with its cohort similarity scores.
+    Used to build the in-memory indexes at startup.
+
+    Args:
+        layout (str, optional): "documents" or "vectors"; defaults to COHORT_STORAGE.
+
+    Yields:
+        tuple: (user_id, emails, interests, cohort_scores) for each profile, where
+               cohort_scores maps cohort name to the stored integer score (0-100).
+    """
+    layout = layout or COHORT_STORAGE
+    db = _get_db()
+
+    scores = {}
+    if layout == "vectors":
+        for doc in db["cohort_vectors"].find({}, {"scores": 1}):
+            scores[doc["_id"]] = unpack_scores(doc["scores"])
+    else:
+        for doc in db["cohort_data"].find(
+            {}, {"user_id": 1, "cohort": 1, "similarity_score": 1, "_id": 0}
+        ):
+            scores.setdefault(doc.get("user_id"), {})[doc.get("cohort")] = int(
+                doc.get("similarity_score", 0)
+            )
+
+    for doc in db["user_profiles"].find(
+        {}, {"user_id": 1, "emails": 1, "interests": 1, "_id": 0}
+    ):
+        user_id = doc.get("user_id")
+        yield (
+            user_id,
+            doc.get("emails") or [],
+            doc.get("interests") or [],
+            scores.get(user_id, {}),
+        )
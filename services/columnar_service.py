@@ -0,0 +1,356 @@
+import threading
+import numpy as np
+from services.mongo_service import connect_to_mongo
+from utils.segmentation_prompt import cohorts as COHORTS
+
+_COHORT_BITS = {cohort: 1 << i for i, cohort in enumerate(COHORTS)}
+
+# Dictionary-encoded columns and the integer type of their codes (-1 = missing).
+ENCODED_COLUMNS = {
+    "gender": np.int16,
+    "income": np.int16,
+    "education": np.int16,
+    "state": np.int16,
+    "country": np.int16,
+    "city": np.int32,
+}
+# Where each encoded column lives on a user profile
+_COLUMN_SOURCES = {
+    "gender": "demographics",
+    "income": "demographics",
+    "education": "demographics",
+    "state": "location",
+    "country": "location",
+    "city": "location",
+}
+GROUPABLE_COLUMNS = ["age"] + list(ENCODED_COLUMNS)
+# Ages outside this range are stored as missing (-1); the age column is int16
+MIN_AGE = 0
+MAX_AGE = 150
+
+
+class ColumnarProfileStore:
+    """
+    Columnar in-memory snapshot of user profiles for audience counting.
+
+    Age is an int16 column, the other demographic and location fields are
+    dictionary-encoded integer columns and cohort membership is a uint16
+    bitmask per row, so filters and group-bys run as vectorized NumPy operations.
+    """
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self._rows = {}  # user_id -> row
+        self._size = 0
+        self._vocab = {name: [] for name in ENCODED_COLUMNS}  # code -> value
+        self._codes = {name: {} for name in ENCODED_COLUMNS}  # value -> code
+        self._allocate(capacity)
+        self.loaded = False
+
+    def __len__(self):
+        return self._size
+
+    def _allocate(self, capacity):
+        self._capacity = capacity
+        self._age = np.full(capacity, -1, dtype=np.int16)
+        self._columns = {
+            name: np.full(capacity, -1, dtype=dtype)
+            for name, dtype in ENCODED_COLUMNS.items()
+        }
+        self._cohorts = np.zeros(capacity, dtype=np.uint16)
+
+    def _grow(self):
+        size, age, columns, cohorts = self._size, self._age, self._columns, self._cohorts
+        self._allocate(self._capacity * 2)
+        self._age[:size] = age[:size]
+        for name, values in columns.items():
+            self._columns[name][:size] = values[:size]
+        self._cohorts[:size] = cohorts[:size]
+
+    def _row(self, user_id):
+        row = self._rows.get(user_id)
+        if row is None:
+            row = self._size
+            if row == self._capacity:
+                self._grow()
+            self._rows[user_id] = row
+            self._size += 1
+        return row
+
+    def _encode(self, name, value):
+        if value is None:
+            return -1
+        code = self._codes[name].get(value)
+        if code is None:
+            code = len(self._vocab[name])
+            self._vocab[name].append(value)
+            self._codes[name][value] = code
+        return code
+
+    def _set_profile(self, user_id, demographics, location, cohort_names=None):
+        sources = {"demographics": demographics or {}, "location": location or {}}
+        age = sources["demographics"].get("age")
+        if isinstance(age, bool) or not isinstance(age, int) or not MIN_AGE <= age <= MAX_AGE:
+            age = -1
+        row = self._row(user_id)
+        self._age[row] = age
+        for name, source in _COLUMN_SOURCES.items():
+            self._columns[name][row] = self._encode(name, sources[source].get(name))
+        if cohort_names is not None:
+            self._set_cohorts(row, cohort_names)
+
+    def _set_cohorts(self, row, cohort_names):
+        mask = 0
+        for cohort in cohort_names:
+            mask |= _COHORT_BITS.get(cohort, 0)
+        self._cohorts[row] = mask
+
+    def upsert_profile(self, user_id, demographics, location):
+        """
+        Inserts or replaces the demographic and location columns of a user.
+
+        Args:
+            user_id (str): The user's id.
+            demographics (dict or None): The profile's demographics.
+            location (dict or None): The profile's location.
+        """
+        with self._lock:
+            self._set_profile(user_id, demographics, location)
+
+    def set_cohorts(self, user_id, cohort_names):
+        """
+        Replaces the cohort memberships of a user.
+
+        Args:
+            user_id (str): The user's id.
+            cohort_names (iterable): Names of the cohorts the user belongs to.
+        """
+        with self._lock:
+            self._set_cohorts(self._row(user_id), cohort_names)
+
+    def bulk_load(self, profiles):
+        """
+        Replaces the store contents with the given profiles.
+
+        Args:
+            profiles (iterable): User profile documents with 'user_id',
+                                 'demographics', 'location' and 'cohorts'.
+        """
+        with self._lock:
+            self._rows = {}
+            self._size = 0
+            self._vocab = {name: [] for name in ENCODED_COLUMNS}
+            self._codes = {name: {} for name in ENCODED_COLUMNS}
+            self._allocate(self._capacity)
+            for profile in profiles:
+                self._set_profile(
+                    profile.get("user_id"),
+                    profile.get("demographics"),
+                    profile.get("location"),
+                    profile.get("cohorts") or [],
+                )
+            self.loaded = True
+
+    def load_arrays(self, user_ids, age, columns, vocab, cohorts):
+        """
+        Replaces the store contents with pre-encoded column arrays.
+        Used by bulk imports and benchmarks that already hold encoded data.
+
+        Args:
+            user_ids (list): user_id of every row.
+            age (numpy.ndarray): Ages, -1 for missing.
+            columns (dict): Encoded column name -> array of codes (-1 for missing).
+            vocab (dict): Encoded column name -> list of values indexed by code.
+            cohorts (numpy.ndarray): Cohort membership bitmask per row.
+        """
+        size = len(user_ids)
+        with self._lock:
+            self._rows = {user_id: row for row, user_id in enumerate(user_ids)}
+            self._size = size
+            self._vocab = {name: list(vocab[name]) for name in ENCODED_COLUMNS}
+            self._codes = {
+                name: {value: code for code, value in enumerate(values)}
+                for name, values in self._vocab.items()
+            }
+            self._allocate(max(size, 1024))
+            self._age[:size] = age
+            for name, dtype in ENCODED_COLUMNS.items():
+                self._columns[name][:size] = np.asarray(columns[name], dtype=dtype)
+            self._cohorts[:size] = cohorts
+            self.loaded = True
+
+    def nbytes(self):
+        """
+        Returns the number of bytes held by the column arrays.
+        """
+        return (
+            self._age.nbytes
+            + sum(values.nbytes for values in self._columns.values())
+            + self._cohorts.nbytes
+        )
+
+    def _match_codes(self, name, wanted):
+        # Case-insensitive lookup of the codes whose value is in 'wanted'
+        wanted = {str(value).lower() for value in wanted}
+        return [
+            code
+            for code, value in enumerate(self._vocab[name])
+            if str(value).lower() in wanted
+        ]
+
+    def count(self, filters=None, group_by=None):
+        """
+        Counts users matching the filters, optionally grouped by columns.
+
+        Args:
+            filters (dict, optional): Supported keys are 'age_min', 'age_max',
+                'cohorts' (a list; the user must be in all of them) and any
+                encoded column name mapped to a list of accepted values.
+            group_by (list, optional): Columns from GROUPABLE_COLUMNS.
+
+        Returns:
+            tuple: (total, groups) where groups is a list of dicts holding one
+                   value per group_by column plus 'count', largest first.
+
+        Raises:
+            ValueError: If a filter or group_by column is unknown, or a filter
+                        value has the wrong type.
+        """
+        filters = filters or {}
+        group_by = group_by or []
+        unknown = set(filters) - {"age_min", "age_max", "cohorts"} - set(ENCODED_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown filters: {sorted(unknown)}")
+        unknown = set(group_by) - set(GROUPABLE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown group_by columns: {sorted(unknown)}")
+
+        for name in ("age_min", "age_max"):
+            value = filters.get(name)
+            if value is not None and (
+                isinstance(value, bool) or not isinstance(value, (int, float))
+            ):
+                raise ValueError(f"{name} must be a number.")
+        for name in ["cohorts"] + list(ENCODED_COLUMNS):
+            if filters.get(name) is not None and not isinstance(filters[name], list):
+                raise ValueError(f"Filter '{name}' must be a list of values.")
+
+        with self._lock:
+            size = self._size
+            mask = np.ones(size, dtype=bool)
+
+            age = self._age[:size]
+            if filters.get("age_min") is not None:
+                mask &= age >= filters["age_min"]
+            if filters.get("age_max") is not None:
+                mask &= (age <= filters["age_max"]) & (age >= 0)
+
+            if filters.get("cohorts"):
+                required = 0
+                for cohort in filters["cohorts"]:
+                    bit = _COHORT_BITS.get(str(cohort).lower())
+                    if bit is None:
+                        raise ValueError(f"Unknown cohort: {cohort}")
+                    required |= bit
+                mask &= (self._cohorts[:size] & required) == required
+
+            for name in ENCODED_COLUMNS:
+                if filters.get(name):
+                    codes = self._match_codes(name, filters[name])
+                    mask &= np.isin(self._columns[name][:size], codes)
+
+            total = int(np.count_nonzero(mask))
+            if not group_by or total == 0:
+                return total, []
+
+            # Combine the group columns into a single int64 key per row
+            keys = np.zeros(total, dtype=np.int64)
+            cardinalities = []
+            for name in group_by:
+                if name == "age":
+                    values = self._age[:size][mask].astype(np.int64)
+                    cardinality = 1 << 15
+                else:
+                    values = self._columns[name][:size][mask].astype(np.int64)
+                    cardinality = len(self._vocab[name]) + 1
+                keys = keys * cardinality + (values + 1)
+                cardinalities.append(cardinality)
+            unique_keys, counts = np.unique(keys, return_counts=True)
+
+            groups = []
+            for key, group_count in zip(unique_keys.tolist(), counts.tolist()):
+                group = {}
+                for name, cardinality in zip(reversed(group_by), reversed(cardinalities)):
+                    key, value = divmod(key, cardinality)
+                    value -= 1
+                    if name == "age":
+                        group[name] = value if value >= 0 else None
+                    else:
+                        group[name] = self._vocab[name][value] if value >= 0 else None
+                group["count"] = group_count
+                groups.append({name: group[name] for name in group_by + ["count"]})
+            groups.sort(key=lambda g: g["count"], reverse=True)
+            return total, groups
+
+
+# Global store shared by the API and the merge/segmentation background tasks
+_profile_store = ColumnarProfileStore()
+
+
+def load_profile_store():
+    """
+    Builds the columnar snapshot from the 'user_profiles' collection into a new
+    store and swaps it in, so counts keep being served from the old snapshot
+    while it loads. Also used to pick up changes made by other worker processes.
+
+    Returns:
+        ColumnarProfileStore: The loaded store.
+    """
+    global _profile_store
+    db = connect_to_mongo().get_default_database()
+    cursor = db["user_profiles"].find(
+        {},
+        {"user_id": 1, "demographics": 1, "location": 1, "cohorts": 1, "_id": 0},
+    )
+    store = ColumnarProfileStore()
+    store.bulk_load(cursor)
+    _profile_store = store
+    print(f"Loaded {len(store)} profiles into the columnar store")
+    return store
+
+
+def get_profile_store():
+    """
+    Returns the global columnar store, building it on first use.
+
+    Returns:
+        ColumnarProfileStore: The loaded store.
+    """
+    if not _profile_store.loaded:
+        load_profile_store()
+    return _profile_store
+
+
+def notify_profile_changed(user_id, demographics, location):
+    """
+    Change notification from the merge path for a created or updated profile.
+
+    Args:
+        user_id (str): The profile's user_id.
+        demographics (dict or None): The merged demographics.
+        location (dict or None): The merged location.
+    """
+    if _profile_store.loaded:
+        _profile_store.upsert_profile(user_id, demographics, location)
+
+
+def notify_cohorts_changed(user_id, cohort_names):
+    """
+    Change notification from segmentation for a user's new cohorts.
+
+    Args:
+        user_id (str): The profile's user_id.
+        cohort_names (iterable): The cohorts the user now belongs to.
+    """
+    if _profile_store.loaded:
+        _profile_store.set_cohorts(user_id, cohort_names)
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from services.mongo_service import connect_to_mongo
+
+# How long idempotency keys and record hashes are remembered
+INGEST_DEDUP_TTL_SECONDS = int(os.getenv("INGEST_DEDUP_TTL_SECONDS", "86400"))
+
+DUPLICATE_KEY_ERROR = 11000
+
+# States of an idempotency key: claimed by a request still being handled, or
+# accepted once its batch was handed off to the pipeline
+KEY_PENDING = "pending"
+KEY_ACCEPTED = "accepted"
+# A pending key older than this belongs to a request that died mid-way
+PENDING_KEY_TIMEOUT_SECONDS = 60
+
+
+def _get_db():
+    db = connect_to_mongo().get_default_database()
+    if db is None:
+        raise ValueError(
+            "No default database specified in MONGO_URI. Please ensure your URI is in the format 'mongodb://host:port/defaultdb'."
+        )
+    return db
+
+
+def ensure_dedup_indexes():
+    """
+    Creates the TTL indexes that expire idempotency keys and record hashes.
+    Uniqueness comes from storing the key/hash as the document _id.
+    """
+    db = _get_db()
+    for name in ("ingest_batches", "ingest_hashes"):
+        db[name].create_index(
+            [("created_at", ASCENDING)], expireAfterSeconds=INGEST_DEDUP_TTL_SECONDS
+        )
+
+
+def content_hash(record):
+    """
+    Hashes the canonical serialization of an ingested record (IngestData as a dict):
+    compact JSON with sorted keys, so equal records always hash the same.
+
+    Args:
+        record (dict): The ingested record.
+
+    Returns:
+        str: 32-character hex BLAKE2b digest.
+    """
+    canonical = json.dumps(record, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def idempotency_key_status(key):
+    """
+    Looks up a batch's Idempotency-Key without claiming it.
+
+    Args:
+        key (str): The header value.
+
+    Returns:
+        str or None: KEY_ACCEPTED, KEY_PENDING while the first request carrying
+                     the key is still being handled, or None for an unknown key
+                     or a stale pending one.
+    """
+    doc = _get_db()["ingest_batches"].find_one({"_id": key})
+    if doc is None:
+        return None
+    # Keys stored before batches had a status were only written once accepted
+    status = doc.get("status", KEY_ACCEPTED)
+    if status == KEY_PENDING and doc["created_at"] < datetime.now() - timedelta(
+        seconds=PENDING_KEY_TIMEOUT_SECONDS
+    ):
+        return None  # left behind by a request that died; claim_idempotency_key takes it over
+    return status
+
+
+def claim_idempotency_key(key):
+    """
+    Records a batch's Idempotency-Key as pending.
+    A pending key left behind by a request that died mid-way can be claimed
+    again once it is older than PENDING_KEY_TIMEOUT_SECONDS.
+
+    Args:
+        key (str): The header value.
+
+    Returns:
+        bool: True if the key was claimed, False if another request holds it
+              or the batch was already accepted.
+    """
+    now = datetime.now()
+    batches = _get_db()["ingest_batches"]
+    try:
+        batches.insert_one({"_id": key, "status": KEY_PENDING, "created_at": now})
+        return True
+    except DuplicateKeyError:
+        stale = batches.update_one(
+            {
+                "_id": key,
+                "status": KEY_PENDING,
+                "created_at": {"$lt": now - timedelta(seconds=PENDING_KEY_TIMEOUT_SECONDS)},
+            },
+            {"$set": {"created_at": now}},
+        )
+        return stale.modified_count == 1
+
+
+def accept_idempotency_key(key):
+    """
+    Marks a claimed key as accepted once its batch has been handed off, so
+    retries with it are answered as duplicates.
+    """
+    _get_db()["ingest_batches"].update_one(
+        {"_id": key}, {"$set": {"status": KEY_ACCEPTED, "created_at": datetime.now()}}
+    )
+
+
+def release_idempotency_key(key):
+    """
+    Forgets a claimed key, so a batch that failed can be retried with it.
+    """
+    _get_db()["ingest_batches"].delete_one({"_id": key})
+
+
+def _forget_batch_hashes(hashes, duplicates):
+    # Some hashes may have been recorded before the insert failed: forget all of
+    # them except known duplicates, so the retried records are not dropped.
+    try:
+        forget_hashes(list({h for i, h in enumerate(hashes) if i not in duplicates}))
+    except Exception as e:
+        print(f"Failed to forget record hashes: {e}")
+
+
+def filter_new_records(records):
+    """
+    Drops records whose content hash was already seen within the TTL window,
+    including repeats inside the same batch, and remembers the new hashes.
+
+    Args:
+        records (list of dict): The ingested records.
+
+    Returns:
+        tuple: (new_records, new_hashes) in the original order.
+
+    Raises:
+        Exception: If recording the hashes fails for another reason than a
+                   duplicate; hashes recorded by this call are forgotten first.
+    """
+    if not records:
+        return [], []
+    hashes = [content_hash(record) for record in records]
+    now = datetime.now()
+    duplicates = set()
+    try:
+        _get_db()["ingest_hashes"].insert_many(
+            [{"_id": h, "created_at": now} for h in hashes], ordered=False
+        )
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        duplicates = {
+            error["index"] for error in errors if error.get("code") == DUPLICATE_KEY_ERROR
+        }
+        if len(duplicates) < len(errors):
+            _forget_batch_hashes(hashes, duplicates)
+            raise
+    except Exception:
+        _forget_batch_hashes(hashes, set())
+        raise
+
+    new_records, new_hashes = [], []
+    for i, (record, h) in enumerate(zip(records, hashes)):
+        if i not in duplicates:
+            new_records.append(record)
+            new_hashes.append(h)
+    return new_records, new_hashes
+
+
+def forget_hashes(hashes):
+    """
+    Removes recorded hashes, so records that failed to ingest can be retried.
+    """
+    if hashes:
+        _get_db()["ingest_hashes"].delete_many({"_id": {"$in": hashes}})
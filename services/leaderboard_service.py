@@ -0,0 +1,201 @@
+import asyncio
+import bisect
+import json
+import os
+import threading
+from datetime import datetime
+from services.cohort_service import fetch_cohort_page
+
+# Cohorts whose first pages are served from memory, and how many entries are kept
+HOT_COHORTS = [
+    cohort.strip().lower()
+    for cohort in os.getenv("HOT_COHORTS", "travel,tech,fitness").split(",")
+    if cohort.strip()
+]
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "100"))
+# Boards only see segmentations run in their own process; reloading them from
+# the database bounds how far workers drift apart (0 disables the reload).
+LEADERBOARD_REFRESH_SECONDS = float(os.getenv("LEADERBOARD_REFRESH_SECONDS", "5"))
+# Pre-serialized pages kept per cohort before the cache is reset
+_MAX_CACHED_PAGES = 256
+
+
+def _sort_key(score, updated_at, email):
+    # Same order as /api/cohort/users: similarity_score desc, updated_at desc, email asc.
+    # MongoDB stores datetimes with millisecond precision, so compare at that precision.
+    timestamp = round(updated_at.timestamp() * 1000) if updated_at else 0
+    return (-score, -timestamp, email)
+
+
+class _Board:
+    def __init__(self):
+        self.keys = []  # sorted (-score, -timestamp_ms, email)
+        # When the cohort has more entries than the board holds, every stored entry
+        # ranking at or before this key is on the board; entries after it are unknown.
+        self.boundary = None
+        self.pages = {}  # (requested cohort, offset, limit) -> response bytes
+
+
+class CohortLeaderboard:
+    """
+    In-memory top-N leaderboard per hot cohort.
+
+    Serves the first pages of /api/cohort/users as pre-serialized response bytes,
+    so popular requests skip the sorted MongoDB query and Pydantic validation.
+    Boards are refreshed from segmentation writes in this process and reloaded
+    from the database periodically; pages beyond the board fall back to the
+    database.
+    """
+
+    def __init__(self, cohorts, size, fetch_page=fetch_cohort_page):
+        """
+        Args:
+            cohorts (list): Lowercase names of the hot cohorts.
+            size (int): Number of entries kept per cohort.
+            fetch_page (callable): Reads a page as fetch_page(cohort, offset, limit).
+        """
+        self.size = size
+        self._fetch_page = fetch_page
+        self._lock = threading.Lock()
+        self._boards = {cohort: _Board() for cohort in cohorts}
+        self.loaded = False
+
+    def _load_board(self, cohort):
+        board = _Board()
+        page = self._fetch_page(cohort, 0, self.size + 1)
+        board.keys = [
+            _sort_key(entry["similarity_score"], entry["updated_at"], entry["email"])
+            for entry in page[: self.size]
+        ]
+        if len(page) > self.size:
+            board.boundary = board.keys[-1]
+        return board
+
+    def load(self):
+        """
+        Reads the top entries of every hot cohort from the database.
+        """
+        boards = {cohort: self._load_board(cohort) for cohort in self._boards}
+        with self._lock:
+            self._boards = boards
+            self.loaded = True
+
+    def update_user(self, emails, cohort_entries, updated_at=None):
+        """
+        Applies one segmentation write: all previous entries of the user's emails
+        are replaced by the new cohort entries.
+
+        Args:
+            emails (list): The user's emails.
+            cohort_entries (list): The saved entries ('email', 'cohort', 'similarity_score').
+            updated_at (datetime, optional): Time of the write; defaults to now.
+        """
+        updated_at = updated_at or datetime.now()
+        emails = set(emails)
+        with self._lock:
+            for cohort, board in self._boards.items():
+                keys = [key for key in board.keys if key[2] not in emails]
+                changed = len(keys) != len(board.keys)
+                for entry in cohort_entries:
+                    if entry["cohort"] != cohort:
+                        continue
+                    key = _sort_key(entry["similarity_score"], updated_at, entry["email"])
+                    if board.boundary is not None and key > board.boundary:
+                        continue  # ranks after entries the board does not hold
+                    bisect.insort(keys, key)
+                    changed = True
+                if len(keys) > self.size:
+                    keys = keys[: self.size]
+                    board.boundary = keys[-1]
+                if changed:
+                    board.keys = keys
+                    board.pages = {}
+
+    def page_bytes(self, requested_cohort, offset, limit):
+        """
+        Returns the serialized SimilarUsersResponse for a page if the board can serve it.
+
+        Args:
+            requested_cohort (str): The cohort as given in the request (echoed back).
+            offset (int): Page offset.
+            limit (int): Page size.
+
+        Returns:
+            bytes or None: The response body, or None when the page must come from the database.
+        """
+        cohort = requested_cohort.lower()
+        board = self._boards.get(cohort)
+        if board is None:
+            return None
+
+        cache_key = (requested_cohort, offset, limit)
+        body = board.pages.get(cache_key)
+        if body is not None:
+            return body
+
+        with self._lock:
+            board = self._boards[cohort]
+            if board.boundary is not None and offset + limit > len(board.keys):
+                if len(board.keys) >= self.size:
+                    return None  # deeper than the board
+                # Removals shrank the board below its size: refill it once
+                board = self._boards[cohort] = self._load_board(cohort)
+                if board.boundary is not None and offset + limit > len(board.keys):
+                    return None
+            users = [
+                {"email": email, "similarity_score": float(-negated_score) / 100.0}
+                for negated_score, _, email in board.keys[offset : offset + limit]
+            ]
+            # Serialized like FastAPI's JSONResponse would
+            body = json.dumps(
+                {"cohort": requested_cohort, "users": users},
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ).encode("utf-8")
+            if len(board.pages) >= _MAX_CACHED_PAGES:
+                board.pages = {}
+            board.pages[cache_key] = body
+            return body
+
+
+# Global leaderboard shared by the API and the segmentation background tasks
+_leaderboard = CohortLeaderboard(HOT_COHORTS, LEADERBOARD_SIZE)
+
+
+def get_leaderboard():
+    """
+    Returns the global leaderboard, loading it from the database on first use.
+
+    Returns:
+        CohortLeaderboard: The loaded leaderboard.
+    """
+    if not _leaderboard.loaded:
+        _leaderboard.load()
+        print(f"Loaded leaderboards for hot cohorts: {', '.join(HOT_COHORTS)}")
+    return _leaderboard
+
+
+async def refresh_leaderboard_periodically():
+    """
+    Reloads the boards from the database every LEADERBOARD_REFRESH_SECONDS, so
+    segmentations run by other worker processes show up; runs until cancelled.
+    """
+    while True:
+        await asyncio.sleep(LEADERBOARD_REFRESH_SECONDS)
+        try:
+            await asyncio.to_thread(_leaderboard.load)
+        except Exception as e:
+            print(f"Failed to refresh leaderboards: {e}")
+
+
+def update_leaderboard(emails, cohort_entries):
+    """
+    Refreshes the hot cohort leaderboards after segmentation.
+    Does nothing until they have been loaded; the initial load reads the latest data.
+
+    Args:
+        emails (list): The segmented user's emails.
+        cohort_entries (list): The cohort entries just saved for this user.
+    """
+    if _leaderboard.loaded:
+        _leaderboard.update_user(emails, cohort_entries)
@@ -0,0 +1,211 @@
+import threading
+import zlib
+import numpy as np
+from services.cohort_service import fetch_user_cohort_scores
+from utils.segmentation_prompt import cohorts as COHORTS
+
+# Number of hashed interest features appended after the 12 cohort scores.
+INTEREST_FEATURES = 20
+# Relative weight of the interest part of the vector against the cohort part.
+INTEREST_WEIGHT = 0.5
+VECTOR_SIZE = len(COHORTS) + INTEREST_FEATURES
+
+_COHORT_POSITIONS = {cohort: i for i, cohort in enumerate(COHORTS)}
+
+
+class LookalikeIndex:
+    """
+    In-memory index of compact per-user vectors used for "users similar to this user".
+
+    Each row holds the 12 cohort similarity scores followed by hashed interest
+    features, L2-normalised so that a dot product is the cosine similarity.
+    Rows live in one contiguous float32 NumPy matrix that grows by doubling.
+    """
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((capacity, VECTOR_SIZE), dtype=np.float32)
+        self._rows = {}  # user_id -> row
+        self._user_ids = []  # row -> user_id
+        self._emails = []  # row -> primary email
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._user_ids)
+
+    def _grow(self):
+        vectors = np.zeros((self._vectors.shape[0] * 2, VECTOR_SIZE), dtype=np.float32)
+        vectors[: self._vectors.shape[0]] = self._vectors
+        self._vectors = vectors
+
+    def _upsert(self, user_id, email, vector):
+        row = self._rows.get(user_id)
+        if row is None:
+            row = len(self._user_ids)
+            if row == self._vectors.shape[0]:
+                self._grow()
+            self._rows[user_id] = row
+            self._user_ids.append(user_id)
+            self._emails.append(email)
+        else:
+            self._emails[row] = email
+        self._vectors[row] = vector
+
+    def upsert(self, user_id, email, cohort_scores, interests):
+        """
+        Inserts or replaces the vector of a single user.
+
+        Args:
+            user_id (str): The user's id.
+            email (str or None): Email returned alongside the user in results.
+            cohort_scores (dict): Mapping of cohort name to similarity score (0-1).
+            interests (list): The user's interests.
+        """
+        vector = build_vector(cohort_scores, interests)
+        with self._lock:
+            self._upsert(user_id, email, vector)
+
+    def bulk_load(self, users):
+        """
+        Replaces the index contents with the given users.
+
+        Args:
+            users (iterable): (user_id, email, cohort_scores, interests) tuples.
+        """
+        with self._lock:
+            self._vectors = np.zeros_like(self._vectors)
+            self._rows = {}
+            self._user_ids = []
+            self._emails = []
+            for user_id, email, cohort_scores, interests in users:
+                self._upsert(user_id, email, build_vector(cohort_scores, interests))
+            self.loaded = True
+
+    def top_k(self, user_id, k=10):
+        """
+        Returns the k users whose vectors are closest to the given user's vector.
+
+        Args:
+            user_id (str): The user to find lookalikes for.
+            k (int): Maximum number of users to return.
+
+        Returns:
+            list or None: List of (user_id, email, similarity) tuples ordered by
+                          similarity desc, or None if the user is not indexed.
+        """
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                return None
+            size = len(self._user_ids)
+            scores = self._vectors[:size] @ self._vectors[row]
+            scores[row] = -np.inf
+
+            k = min(k, size - 1)
+            if k <= 0:
+                return []
+            candidates = np.argpartition(-scores, k)[:k]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+            return [
+                (self._user_ids[i], self._emails[i], float(scores[i]))
+                for i in candidates
+                if scores[i] > 0
+            ]
+
+
+def build_vector(cohort_scores, interests):
+    """
+    Builds the normalised vector for a user.
+
+    Args:
+        cohort_scores (dict): Mapping of cohort name to similarity score (0-1).
+        interests (list): The user's interests; hashed case-insensitively into buckets.
+
+    Returns:
+        numpy.ndarray: float32 vector of length VECTOR_SIZE.
+    """
+    vector = np.zeros(VECTOR_SIZE, dtype=np.float32)
+    for cohort, score in cohort_scores.items():
+        position = _COHORT_POSITIONS.get(cohort)
+        if position is not None:
+            vector[position] = score
+
+    interest_part = vector[len(COHORTS) :]
+    for interest in interests or []:
+        if isinstance(interest, str):
+            bucket = zlib.crc32(interest.lower().encode("utf-8")) % INTEREST_FEATURES
+            interest_part[bucket] += 1.0
+    interest_norm = np.linalg.norm(interest_part)
+    if interest_norm > 0:
+        interest_part *= INTEREST_WEIGHT / interest_norm
+
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+def _load_users():
+    """
+    Reads every user's interests and cohort scores from MongoDB.
+
+    Yields:
+        tuple: (user_id, email, cohort_scores, interests) for each profile.
+    """
+    for user_id, emails, interests, scores in fetch_user_cohort_scores():
+        cohort_scores = {cohort: score / 100.0 for cohort, score in scores.items()}
+        yield user_id, emails[0] if emails else None, cohort_scores, interests
+
+
+# Global index shared by the API and the segmentation background tasks
+_lookalike_index = LookalikeIndex()
+
+
+def get_lookalike_index():
+    """
+    Returns the global lookalike index, building it from MongoDB on first use.
+
+    Returns:
+        LookalikeIndex: The loaded index.
+    """
+    if not _lookalike_index.loaded:
+        _lookalike_index.bulk_load(_load_users())
+        print(f"Loaded {len(_lookalike_index)} users into the lookalike index")
+    return _lookalike_index
+
+
+def reload_lookalike_index():
+    """
+    Rebuilds the lookalike index from MongoDB into a new index and swaps it in,
+    so queries keep being served from the old one while the new one loads.
+    Picks up segmentations made by other worker processes.
+    """
+    global _lookalike_index
+    index = LookalikeIndex()
+    index.bulk_load(_load_users())
+    _lookalike_index = index
+
+
+def update_lookalike_index(user_id, emails, segments, interests):
+    """
+    Refreshes a single user's vector after segmentation.
+    Does nothing until the index has been built; the initial build reads the latest data.
+
+    Args:
+        user_id (str): The segmented user's id.
+        emails (list): The user's emails.
+        segments (list): Segments as returned by get_cohorts_from_interests.
+        interests (list): The user's interests.
+    """
+    if not _lookalike_index.loaded:
+        return
+    cohort_scores = {}
+    for segment in segments:
+        cohort = segment.get("cohort")
+        score = segment.get("similarity_score")
+        if cohort and score is not None and cohort not in cohort_scores:
+            cohort_scores[cohort] = float(score)
+    _lookalike_index.upsert(
+        user_id, emails[0] if emails else None, cohort_scores, interests
+    )
@@ -1,10 +1,11 @@
 import os
 import copy
 from datetime import datetime
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
 
-# Global variable to hold MongoDB client
+# Global variable to hold MongoDB client, and the id of the process that created it
 _mongo_client = None
+_mongo_client_pid = None
 
 
 def connect_to_mongo():
@@ -12,20 +13,78 @@ def connect_to_mongo():
     Connects to MongoDB using the MONGO_URI environment variable.
     Caches the connection to avoid reconnecting.
 
+    The client is owned by the process that created it: a worker forked from a
+    parent that already connected gets a fresh client instead of the inherited one,
+    since MongoClient is not fork-safe.
+
     Returns:
         MongoClient: A connected MongoClient instance.
     """
-    global _mongo_client
-    if _mongo_client is None:
+    global _mongo_client, _mongo_client_pid
+    if _mongo_client is None or _mongo_client_pid != os.getpid():
         mongo_uri = os.getenv("MONGO_URI")
         if not mongo_uri:
             raise EnvironmentError("MONGO_URI not set in environment variables.")
-        _mongo_client = MongoClient(mongo_uri)
-        print("Connected to MongoDB Successfully")
+        _mongo_client = MongoClient(
+            mongo_uri, minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+        )
+        _mongo_client_pid = os.getpid()
+        print(f"Connected to MongoDB Successfully (pid {_mongo_client_pid})")
 
     return _mongo_client
 
 
+def close_mongo_connection():
+    """
+    Closes the current process's MongoDB client, if any.
+    """
+    global _mongo_client, _mongo_client_pid
+    if _mongo_client is not None and _mongo_client_pid == os.getpid():
+        _mongo_client.close()
+    _mongo_client = None
+    _mongo_client_pid = None
+
+
+def warm_up_mongo():
+    """
+    Opens the connection pool and verifies the server answers before serving traffic.
+    The pool is filled up to MONGO_MIN_POOL_SIZE connections in the background.
+
+    Raises:
+        pymongo.errors.PyMongoError: If the server cannot be reached.
+    """
+    client = connect_to_mongo()
+    client.admin.command("ping")
+
+
+def ensure_indexes():
+    """
+    Creates the indexes the API and the background processing rely on.
+    Safe to call on every startup; existing indexes are left untouched.
+    """
+    client = connect_to_mongo()
+    db = client.get_default_database()
+
+    if db is None:
+        raise ValueError(
+            "No default database specified in MONGO_URI. Please ensure your URI is in the format 'mongodb://host:port/defaultdb'."
+        )
+
+    db["user_profiles"].create_index([("user_id", ASCENDING)])
+    db["user_profiles"].create_index([("emails", ASCENDING)])
+    db["user_profiles"].create_index([("cookies", ASCENDING)])
+    db["cohort_data"].create_index([("email", ASCENDING)])
+    db["cohort_data"].create_index([("user_id", ASCENDING)])
+    db["cohort_data"].create_index(
+        [
+            ("cohort", ASCENDING),
+            ("similarity_score", DESCENDING),
+            ("updated_at", DESCENDING),
+            ("email", ASCENDING),
+        ]
+    )
+
+
 def fetch_from_mongo(collection_name, query, sort=None):
     """
     Fetches documents from MongoDB based on a given query.
@@ -174,3 +233,4 @@ def delete_from_mongo(collection_name, query):
     result = collection.delete_many(query)
     print(f"Deleted {result.deleted_count} documents from '{collection_name}'.")
     return result
+
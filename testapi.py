@@ -46,6 +46,35 @@ def test_ingest():
     print("Ingest Response:", response.status_code, response.json())
 
 
+# ---------- 1b. Test Ingest Retry with Idempotency-Key ----------
+
+
+def test_ingest_retry_is_deduplicated():
+    retry_payload = {
+        "data": [
+            {
+                "cookie": "retry123cookie",
+                "email": "retry@example.com",
+                "phone_number": "+1222333444",
+                "location": {"state": "Ohio", "country": "USA", "city": "Columbus"},
+                "demographics": {
+                    "age": 41,
+                    "gender": "Female",
+                    "income": "$90,000-$110,000",
+                    "education": "Master's Degree",
+                },
+                "interests": ["finance", "travel"],
+            }
+        ]
+    }
+    headers = {"Idempotency-Key": "retry-batch-001"}
+    for attempt in (1, 2):
+        response = requests.post(
+            f"{BASE_URL}/ingest", json=retry_payload, headers=headers
+        )
+        print(f"Ingest Attempt {attempt} Response:", response.status_code, response.json())
+
+
 # ---------- 2. Test Get User by Email ----------
 
 
@@ -85,8 +114,46 @@ def test_get_users_by_cohort():
     )
 
 
+# ---------- 5. Test Get Lookalike Users ----------
+
+
+def test_get_lookalike_users():
+    params_lookalike = {"email": "user1@example.com", "limit": 5}
+    response = requests.get(f"{BASE_URL}/user/lookalikes", params=params_lookalike)
+    print(
+        "Get Lookalike Users Response:",
+        response.status_code,
+        json.dumps(response.json(), indent=2),
+    )
+
+
+# ---------- 6. Test Audience Query ----------
+
+
+def test_audience_query():
+    audience_payload = {
+        "expression": {
+            "and": [
+                {"cohort": "travel", "min_score": 0.5},
+                {"not": {"cohort": "finance"}},
+            ]
+        },
+        "include_members": True,
+        "limit": 5,
+    }
+    response = requests.post(f"{BASE_URL}/audience/query", json=audience_payload)
+    print(
+        "Audience Query Response:",
+        response.status_code,
+        json.dumps(response.json(), indent=2),
+    )
+
+
 if __name__ == "__main__":
     # test_ingest()
+    # test_ingest_retry_is_deduplicated()
     test_get_user_by_email()
     test_get_user_by_cookie()
     test_get_users_by_cohort()
+    test_get_lookalike_users()
+    test_audience_query()
@@ -0,0 +1,146 @@
+import json
+from datetime import datetime, timedelta
+from services.leaderboard_service import CohortLeaderboard
+
+START = datetime(2025, 1, 1)
+
+
+class FakeCohortData:
+    """
+    Stands in for fetch_cohort_page: keeps (email, cohort, score, updated_at)
+    rows and pages them in the same order as MongoDB.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.fetches = 0
+
+    def add(self, email, cohort, score, minutes=0):
+        self.rows = [r for r in self.rows if (r[0], r[1]) != (email, cohort)]
+        self.rows.append((email, cohort, score, START + timedelta(minutes=minutes)))
+
+    def fetch_page(self, cohort, offset, limit):
+        self.fetches += 1
+        rows = sorted(
+            (r for r in self.rows if r[1] == cohort),
+            key=lambda r: (-r[2], -r[3].timestamp(), r[0]),
+        )
+        return [
+            {"email": email, "similarity_score": score, "updated_at": updated_at}
+            for email, _, score, updated_at in rows[offset : offset + limit]
+        ]
+
+
+def make_board(users, size=5):
+    data = FakeCohortData()
+    for i in range(users):
+        data.add(f"user{i:02d}@example.com", "travel", 90 - i, minutes=i)
+    board = CohortLeaderboard(["travel"], size, fetch_page=data.fetch_page)
+    board.load()
+    return data, board
+
+
+def page(board, offset, limit, cohort="travel"):
+    body = board.page_bytes(cohort, offset, limit)
+    return None if body is None else json.loads(body)
+
+
+def expected(data, offset, limit, cohort="travel"):
+    return {
+        "cohort": cohort,
+        "users": [
+            {"email": entry["email"], "similarity_score": entry["similarity_score"] / 100.0}
+            for entry in data.fetch_page(cohort, offset, limit)
+        ],
+    }
+
+
+# ---------- Test 1: First pages match the database ----------
+
+
+def test_first_pages_match_database():
+    data, board = make_board(users=12)
+    assert page(board, 0, 3) == expected(data, 0, 3)
+    assert page(board, 3, 2) == expected(data, 3, 2)
+    # Cached bytes are served again without a new read
+    fetches = data.fetches
+    assert page(board, 0, 3) == expected(data, 0, 3)
+    assert data.fetches == fetches + 1  # only the expected() call above
+    # Unknown cohorts and the requested casing
+    assert board.page_bytes("food", 0, 3) is None
+    assert page(board, 0, 1, cohort="Travel")["cohort"] == "Travel"
+
+
+# ---------- Test 2: Pages past the board fall back to the database ----------
+
+
+def test_deep_pages_fall_back():
+    data, board = make_board(users=12)
+    assert page(board, 0, 5) is not None
+    assert page(board, 3, 3) is None
+    assert page(board, 10, 5) is None
+    # A cohort smaller than the board is complete, so any page is served
+    data, board = make_board(users=3)
+    assert page(board, 0, 10) == expected(data, 0, 10)
+    assert page(board, 5, 10) == {"cohort": "travel", "users": []}
+
+
+# ---------- Test 3: Segmentation writes move entries around the boundary ----------
+
+
+def test_updates_respect_boundary():
+    data, board = make_board(users=12)
+    now = START + timedelta(days=1)
+
+    # Ranks above the boundary: inserted, the last entry is pushed out
+    data.add("new@example.com", "travel", 95, minutes=24 * 60)
+    board.update_user(
+        ["new@example.com"],
+        [{"email": "new@example.com", "cohort": "travel", "similarity_score": 95}],
+        updated_at=now,
+    )
+    assert page(board, 0, 5) == expected(data, 0, 5)
+
+    # Ranks below the boundary: the board cannot know its position, so it is ignored
+    data.add("low@example.com", "travel", 10, minutes=24 * 60)
+    board.update_user(
+        ["low@example.com"],
+        [{"email": "low@example.com", "cohort": "travel", "similarity_score": 10}],
+        updated_at=now,
+    )
+    assert page(board, 0, 5) == expected(data, 0, 5)
+    assert "low@example.com" not in json.dumps(page(board, 0, 5))
+
+
+# ---------- Test 4: Removals below the board size trigger a reload ----------
+
+
+def test_removal_refills_board():
+    data, board = make_board(users=12)
+    # user00 leaves the cohort: previous entries of the email are removed
+    data.rows = [r for r in data.rows if r[0] != "user00@example.com"]
+    board.update_user(["user00@example.com"], [])
+    fetches = data.fetches
+    assert page(board, 0, 5) == expected(data, 0, 5)
+    assert data.fetches == fetches + 2  # the refill and the expected() call
+
+
+# ---------- Test 5: Reloading picks up writes from other workers ----------
+
+
+def test_reload_sees_other_workers():
+    data, board = make_board(users=12)
+    # Written by another process: this board has not seen it
+    data.add("elsewhere@example.com", "travel", 99, minutes=30)
+    assert page(board, 0, 5) != expected(data, 0, 5)
+    board.load()
+    assert page(board, 0, 5) == expected(data, 0, 5)
+
+
+if __name__ == "__main__":
+    test_first_pages_match_database()
+    test_deep_pages_fall_back()
+    test_updates_respect_boundary()
+    test_removal_refills_board()
+    test_reload_sees_other_workers()
+    print("All leaderboard tests passed")
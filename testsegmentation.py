@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from services.ai_service import get_cohorts_from_interests
+from utils import metrics
+
+# Replies the fake OpenAI server sends back, one per chat completion request
+FAKE_REPLIES = []
+# Request bodies received by the fake server
+RECEIVED = []
+# When true, requests asking for a json_schema response format get a 400
+REJECT_STRUCTURED_OUTPUT = False
+# When true, every request gets a 400 unrelated to the response format
+REJECT_CONTENT = False
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        RECEIVED.append(body)
+
+        if REJECT_CONTENT:
+            self._send(
+                400,
+                {
+                    "error": {
+                        "message": "The prompt was flagged by the content filter",
+                        "type": "invalid_request_error",
+                        "code": "content_filter",
+                    }
+                },
+            )
+            return
+
+        if REJECT_STRUCTURED_OUTPUT and "response_format" in body:
+            self._send(
+                400,
+                {
+                    "error": {
+                        "message": "response_format json_schema is not supported",
+                        "type": "invalid_request_error",
+                    }
+                },
+            )
+            return
+
+        self._send(
+            200,
+            {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body.get("model"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": FAKE_REPLIES.pop(0)},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+            },
+        )
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+def start_fake_server():
+    # Started once, on first use; the OpenAI client is built per call, so it
+    # picks up the base URL set here
+    global _server
+    if _server is None:
+        _server = HTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{_server.server_port}/v1"
+        os.environ["OPENAI_API_KEY"] = "fake-key"
+    return _server
+
+
+def run_case(label, replies):
+    start_fake_server()
+    FAKE_REPLIES[:] = replies
+    RECEIVED.clear()
+    segments = get_cohorts_from_interests("test-user", ["hiking", "cameras"])
+    print(f"{label} | calls: {len(RECEIVED)}")
+    print(json.dumps(segments, indent=2))
+    return segments
+
+
+# ---------- Test 1: Stray text, unknown cohort and out-of-range score ----------
+
+
+def test_salvage_stray_text():
+    segments = run_case(
+        "Stray Text",
+        [
+            'Sure! ```json\n[{"cohort": "travel", "similarity_score": 0.923}, '
+            '{"cohort": "cooking", "similarity_score": 0.5}, '
+            '{"cohort": "Photography", "similarity_score": 1.7}]``` Hope this helps!'
+        ],
+    )
+    assert segments == [
+        {"cohort": "travel", "similarity_score": 0.92},
+        {"cohort": "photography", "similarity_score": 1.0},
+    ]
+    assert len(RECEIVED) == 1
+
+
+# ---------- Test 2: Truncated structured output ----------
+
+
+def test_salvage_truncated_output():
+    segments = run_case(
+        "Truncated Output",
+        ['{"cohorts": [{"cohort": "outdoor", "similarity_score": 0.81}, {"cohort": "pho'],
+    )
+    assert segments == [{"cohort": "outdoor", "similarity_score": 0.81}]
+    assert len(RECEIVED) == 1
+
+
+# ---------- Test 3: Nothing salvageable, then a valid reply ----------
+
+
+def test_retry_only_when_nothing_valid():
+    segments = run_case(
+        "Retry After Garbage",
+        [
+            "I'm sorry, I can't help with that.",
+            "[{'cohort': 'food', 'similarity_score': '0.4'}]",
+        ],
+    )
+    assert segments == [{"cohort": "food", "similarity_score": 0.4}]
+    assert len(RECEIVED) == 2
+
+
+# ---------- Test 4: Server without structured output support ----------
+
+
+def test_structured_output_fallback():
+    global REJECT_STRUCTURED_OUTPUT
+    import services.ai_service as ai_service
+
+    ai_service._structured_output = True
+    REJECT_STRUCTURED_OUTPUT = True
+    try:
+        segments = run_case(
+            "Structured Output Rejected",
+            ['[{"cohort": "tech", "similarity_score": 0.6}]'],
+        )
+    finally:
+        REJECT_STRUCTURED_OUTPUT = False
+    assert segments == [{"cohort": "tech", "similarity_score": 0.6}]
+    assert "response_format" in RECEIVED[0]
+    assert "response_format" not in RECEIVED[-1]
+
+
+# ---------- Test 5: Unrelated bad request keeps structured outputs ----------
+
+
+def test_unrelated_bad_request():
+    global REJECT_CONTENT
+    import services.ai_service as ai_service
+
+    start_fake_server()
+    ai_service._structured_output = True
+    REJECT_CONTENT = True
+    RECEIVED.clear()
+    try:
+        get_cohorts_from_interests("test-user", ["hiking"])
+        raise AssertionError("Expected the bad request to be raised")
+    except ai_service.BadRequestError:
+        pass
+    finally:
+        REJECT_CONTENT = False
+    assert ai_service._structured_output
+    assert len(RECEIVED) == 1
+
+    run_case(
+        "After Unrelated Bad Request",
+        ['[{"cohort": "travel", "similarity_score": 0.7}]'],
+    )
+    assert "response_format" in RECEIVED[0]
+
+
+if __name__ == "__main__":
+    test_salvage_stray_text()
+    test_salvage_truncated_output()
+    test_retry_only_when_nothing_valid()
+    test_structured_output_fallback()
+    test_unrelated_bad_request()
+    print("Metrics:", json.dumps(metrics.snapshot(), indent=2))
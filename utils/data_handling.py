@@ -2,9 +2,31 @@ import uuid
 from datetime import datetime
 from services.mongo_service import *
 from services.ai_service import get_cohorts_from_interests
+from services.cohort_service import save_user_cohorts
+from services.lookalike_service import update_lookalike_index
+from services.audience_service import update_audience_index
+from services.columnar_service import notify_profile_changed, notify_cohorts_changed
+from services.leaderboard_service import update_leaderboard
 from decimal import Decimal, ROUND_HALF_UP
 
 
+def dedupe_interests(interests):
+    """
+    Removes duplicate interests case-insensitively, keeping the first occurrence
+    (and its original casing) and skipping non-string values.
+    """
+    seen_lower = set()
+    unique_interests = []
+    for interest in interests:
+        if not isinstance(interest, str):
+            continue  # safety check
+        interest_lower = interest.lower()
+        if interest_lower not in seen_lower:
+            seen_lower.add(interest_lower)
+            unique_interests.append(interest)
+    return unique_interests
+
+
 def flatten_dict(d):
     items = []
     for k, v in d.items():
@@ -18,7 +40,7 @@ def flatten_dict(d):
 async def perform_segmentation(user_id):
     """
     For a given user_id, fetch the user from 'user_profiles', extract interests and emails,
-    call get_cohorts_from_interests, and insert cohort data into 'cohort_data'.
+    call get_cohorts_from_interests, and save the cohort data (see services/cohort_service.py).
     For each email and each cohort segment, insert a record (email, cohort as composite key).
     Also update the user's 'cohorts' field in user_profiles with the new cohort names.
     """
@@ -39,8 +61,6 @@ async def perform_segmentation(user_id):
     cohort_entries = []
     cohort_names = set()
     for email in emails:
-        # Delete all cohort_data entries for this email before inserting new ones
-        delete_from_mongo("cohort_data", {"email": email})
         seen_cohorts = set()
         for segment in segments:
             cohort = segment.get("cohort")
@@ -59,8 +79,8 @@ async def perform_segmentation(user_id):
                     }
                 )
                 cohort_names.add(cohort)
-    if cohort_entries:
-        insert_into_mongo("cohort_data", cohort_entries)
+    # Replace the user's stored cohorts (layout chosen by COHORT_STORAGE)
+    save_user_cohorts(user_id, emails, cohort_entries)
     # Update the user's cohorts field in user_profiles
     if cohort_names:
         update_in_mongo(
@@ -68,6 +88,12 @@ async def perform_segmentation(user_id):
             {"user_id": user_id},
             {"$set": {"cohorts": list(cohort_names)}},
         )
+        notify_cohorts_changed(user_id, cohort_names)
+    # Keep the in-memory lookalike vectors, audience bitmaps and hot cohort
+    # leaderboards in step with the stored cohorts
+    update_lookalike_index(user_id, emails, segments, interests)
+    update_audience_index(user_id, emails, cohort_entries)
+    update_leaderboard(emails, cohort_entries)
 
 
 async def process_and_segment_user(user: dict):
@@ -111,16 +137,7 @@ async def process_and_segment_user(user: dict):
         incoming_interests = user.get("interests", []) or []
         existing_interests = existing_user.get("interests", []) or []
 
-        seen_lower = set()
-        combined_interests = []
-
-        for interest in incoming_interests + existing_interests:
-            if not isinstance(interest, str):
-                continue  # safety check
-            interest_lower = interest.lower()
-            if interest_lower not in seen_lower:
-                seen_lower.add(interest_lower)
-                combined_interests.append(interest)
+        combined_interests = dedupe_interests(incoming_interests + existing_interests)
 
         # Merge demographics and location (prefer new if present)
         demographics = user.get("demographics") or existing_user.get("demographics")
@@ -147,6 +164,7 @@ async def process_and_segment_user(user: dict):
 
         update_query = {"$set": update_fields}
         update_in_mongo("user_profiles", {"user_id": user_id}, update_query)
+        notify_profile_changed(user_id, demographics, location)
 
     else:
         # New user creation
@@ -156,15 +174,7 @@ async def process_and_segment_user(user: dict):
         incoming_interests = user.get("interests", []) or []
 
         # Deduplicate interests in case new user sends duplicates
-        seen_lower = set()
-        unique_interests = []
-        for interest in incoming_interests:
-            if not isinstance(interest, str):
-                continue
-            interest_lower = interest.lower()
-            if interest_lower not in seen_lower:
-                seen_lower.add(interest_lower)
-                unique_interests.append(interest)
+        unique_interests = dedupe_interests(incoming_interests)
 
         new_user = {
             "user_id": user_id,
@@ -192,6 +202,9 @@ async def process_and_segment_user(user: dict):
                 new_user[k] = v
 
         insert_into_mongo("user_profiles", new_user)
+        notify_profile_changed(
+            user_id, new_user.get("demographics"), new_user.get("location")
+        )
 
     # Perform segmentation
     await perform_segmentation(user_id)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, conint
 from typing import List, Optional, Dict, Any
 
 
@@ -9,7 +9,7 @@ class Location(BaseModel):
 
 
 class Demographics(BaseModel):
-    age: Optional[int]
+    age: Optional[conint(ge=0, le=150)]
     gender: Optional[str]
     income: Optional[str]
     education: Optional[str]
@@ -31,6 +31,7 @@ class IngestRequest(BaseModel):
 class IngestResponse(BaseModel):
     status: str
     records_processed: int
+    records_deduplicated: int = 0
     errors: List[str] = []
 
 
@@ -46,3 +47,55 @@ class SimilarUser(BaseModel):
 class SimilarUsersResponse(BaseModel):
     cohort: str
     users: List[SimilarUser]
+
+
+class LookalikeUser(BaseModel):
+    user_id: str
+    email: Optional[EmailStr]
+    similarity_score: float
+
+
+class LookalikesResponse(BaseModel):
+    user_id: str
+    users: List[LookalikeUser]
+
+
+class AudienceQueryRequest(BaseModel):
+    expression: Dict[str, Any]
+    include_members: bool = False
+    limit: int = Field(10, ge=1, le=1000)
+    offset: int = Field(0, ge=0)
+
+
+class AudienceMember(BaseModel):
+    user_id: str
+    emails: List[str]
+
+
+class AudienceQueryResponse(BaseModel):
+    count: int
+    members: List[AudienceMember] = []
+
+
+class AudienceCountFilters(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    age_min: Optional[int] = Field(None, ge=0)
+    age_max: Optional[int] = Field(None, ge=0)
+    cohorts: Optional[List[str]] = None
+    gender: Optional[List[str]] = None
+    income: Optional[List[str]] = None
+    education: Optional[List[str]] = None
+    state: Optional[List[str]] = None
+    country: Optional[List[str]] = None
+    city: Optional[List[str]] = None
+
+
+class AudienceCountRequest(BaseModel):
+    filters: AudienceCountFilters = Field(default_factory=AudienceCountFilters)
+    group_by: List[str] = []
+
+
+class AudienceCountResponse(BaseModel):
+    count: int
+    groups: List[Dict[str, Any]] = []
@@ -0,0 +1,97 @@
+import asyncio
+from utils import metrics
+from utils.data_handling import dedupe_interests
+
+
+def fold_records(older, newer):
+    """
+    Folds two ingest records for the same identity into one merged delta,
+    using the same rules as the profile merge: interests are combined newest
+    first without case-insensitive duplicates, and any other field takes the
+    newer value when it is present.
+
+    Args:
+        older (dict): The record buffered so far.
+        newer (dict): The record that just arrived.
+
+    Returns:
+        dict: The folded record.
+    """
+    folded = dict(older)
+    for k, v in newer.items():
+        if k == "interests":
+            folded[k] = dedupe_interests((v or []) + (older.get(k) or []))
+        elif v:
+            folded[k] = v
+    return folded
+
+
+class IngestCoalescer:
+    """
+    Buffers bursty ingest records per identity (cookie + email) for a fixed window,
+    then submits one folded record per identity for processing, so a burst costs
+    one profile write and at most one segmentation.
+    """
+
+    def __init__(self, window_seconds, submit):
+        """
+        Args:
+            window_seconds (float): How long the first record of a burst waits for more.
+            submit (callable): Called as submit(user, lane, records, profiles) with each
+                               folded record, its lane, the number of records it
+                               replaces and the profiles attached to them.
+        """
+        self.window_seconds = window_seconds
+        self._submit = submit
+        self._pending = {}  # identity -> [folded record, lane, record count, profiles]
+        metrics.register_gauge("ingest.coalesce.pending", lambda: len(self._pending))
+        metrics.register_gauge("ingest.coalesce.ratio", self.ratio)
+
+    @staticmethod
+    def identity_key(user):
+        return (user.get("cookie"), user.get("email"))
+
+    def add(self, user, lane, profile=None):
+        """
+        Buffers a record; must be called from the event loop.
+
+        Args:
+            user (dict): An ingested record (IngestData as a dict).
+            lane (int): Priority lane of the record; a folded record takes the most urgent.
+            profile (Profile, optional): Profile of the request the record came from.
+        """
+        profiles = [profile] if profile else []
+        metrics.increment("ingest.coalesce.records_in")
+        key = self.identity_key(user)
+        if key in self._pending:
+            entry = self._pending[key]
+            entry[0] = fold_records(entry[0], user)
+            entry[1] = min(entry[1], lane)
+            entry[2] += 1
+            entry[3].extend(profiles)
+            return
+        self._pending[key] = [dict(user), lane, 1, profiles]
+        asyncio.get_running_loop().call_later(self.window_seconds, self._flush, key)
+
+    def _flush(self, key):
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return
+        metrics.increment("ingest.coalesce.records_out")
+        self._submit(*entry)
+
+    def ratio(self):
+        """
+        Returns how many ingested records were folded into each processed record.
+        """
+        records_in = metrics.get("ingest.coalesce.records_in")
+        records_out = metrics.get("ingest.coalesce.records_out")
+        return round(records_in / records_out, 3) if records_out else None
+
+    def flush_all(self):
+        """
+        Submits every buffered identity immediately.
+        Used on shutdown so no buffered record is lost.
+        """
+        for key in list(self._pending):
+            self._flush(key)
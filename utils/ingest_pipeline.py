@@ -0,0 +1,198 @@
+import asyncio
+import itertools
+import math
+import time
+from collections import deque
+from utils import metrics
+
+# Priority lanes: lower value is served first
+INTERACTIVE = 0
+BULK = 1
+LANES = {"interactive": INTERACTIVE, "bulk": BULK}
+
+
+class IngestPipeline:
+    """
+    Bounded background pipeline for ingested records.
+
+    Admission control caps the number of records in flight (queued or being
+    processed); bulk traffic may only use a share of that capacity so interactive
+    traffic is still admitted while a backfill saturates the pipeline. Records wait
+    in a priority queue where interactive work jumps ahead of bulk work, and a
+    fixed pool of workers runs the blocking merge/segmentation in threads so the
+    event loop stays free to serve API requests.
+
+    The merge is a find-then-write, so records sharing a cookie or email are
+    never processed at the same time: a record whose identity is busy waits
+    until the record holding it finishes, then goes back into the queue ahead
+    of newer work of its lane.
+    """
+
+    def __init__(self, process, max_in_flight, concurrency, bulk_share=0.8):
+        """
+        Args:
+            process (callable): Async function processing one record.
+            max_in_flight (int): Maximum number of records admitted and not yet processed.
+            concurrency (int): Number of records processed at the same time.
+            bulk_share (float): Fraction of max_in_flight the bulk lane may use.
+        """
+        self._process = process
+        self.max_in_flight = max_in_flight
+        self.concurrency = concurrency
+        self.bulk_share = bulk_share
+        self._in_flight = 0
+        self._queued = {INTERACTIVE: 0, BULK: 0}
+        self._sequence = itertools.count()
+        self._queue = None
+        self._workers = []
+        self._busy = {}  # identity key being processed -> deque of records waiting for it
+        self._avg_seconds = 1.0  # moving average of processing time per record
+        metrics.register_gauge("ingest.in_flight", lambda: self._in_flight)
+        metrics.register_gauge("ingest.queued.interactive", lambda: self._queued[INTERACTIVE])
+        metrics.register_gauge("ingest.queued.bulk", lambda: self._queued[BULK])
+        metrics.register_gauge(
+            "ingest.waiting_on_identity",
+            lambda: sum(len(waiting) for waiting in self._busy.values()),
+        )
+
+    def try_admit(self, records, lane):
+        """
+        Reserves capacity for a batch; must be called from the event loop.
+
+        Args:
+            records (int): Number of records in the batch.
+            lane (int): INTERACTIVE or BULK.
+
+        Returns:
+            bool: True if the batch was admitted, False if the pipeline is saturated.
+        """
+        limit = self.max_in_flight
+        if lane == BULK:
+            limit = int(limit * self.bulk_share)
+        if self._in_flight + records > limit:
+            metrics.increment("ingest.rejected.saturated", records)
+            return False
+        self._in_flight += records
+        return True
+
+    def release(self, records):
+        """
+        Frees capacity reserved by try_admit for records that will not be processed.
+        """
+        self._in_flight -= records
+
+    def retry_after(self):
+        """
+        Estimates in whole seconds how long until the current backlog is worked off.
+        """
+        backlog_seconds = self._in_flight * self._avg_seconds / self.concurrency
+        return min(max(math.ceil(backlog_seconds), 1), 60)
+
+    def submit(self, user, lane, records=1, profiles=()):
+        """
+        Queues an admitted record for processing.
+
+        Args:
+            user (dict): The record to process.
+            lane (int): INTERACTIVE or BULK.
+            records (int): How many admitted records this one stands for
+                           (more than one when records were coalesced).
+            profiles (list, optional): Profiles of the requests the record came from,
+                                       each with one part begun for it.
+        """
+        self._queued[lane] += 1
+        self._queue.put_nowait((lane, next(self._sequence), user, records, profiles))
+
+    async def start(self):
+        """
+        Starts the worker tasks; called from the app lifespan.
+        """
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+
+    async def stop(self, timeout=None):
+        """
+        Waits for queued records to be processed, then stops the workers.
+
+        Args:
+            timeout (float, optional): Longest time to wait in seconds; records
+                                       still queued afterwards are dropped.
+        """
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                print(
+                    f"Ingest pipeline stopped with {self._in_flight} records not processed"
+                )
+                metrics.increment("ingest.dropped_on_shutdown", self._in_flight)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    @staticmethod
+    def identity_keys(user):
+        """
+        Returns the identity keys under which a record is merged into a profile.
+        """
+        keys = []
+        if user.get("cookie"):
+            keys.append(("cookie", user["cookie"]))
+        if user.get("email"):
+            keys.append(("email", user["email"]))
+        return keys
+
+    def _claim(self, item):
+        # Marks the record's identity busy, or parks it behind the record holding it
+        keys = self.identity_keys(item[2])
+        for key in keys:
+            if key in self._busy:
+                self._busy[key].append(item)
+                return None
+        for key in keys:
+            self._busy[key] = deque()
+        return keys
+
+    def _release_keys(self, keys):
+        # Puts the records parked on these identities back into the queue
+        for key in keys:
+            for item in self._busy.pop(key):
+                self._queued[item[0]] += 1
+                self._queue.put_nowait(item)
+                self._queue.task_done()  # the parked get, now covered by the new put
+
+    def _run(self, user, profiles):
+        # Runs in a worker thread with its own event loop
+        for profile in profiles:
+            profile.attach_thread("background")
+        try:
+            asyncio.run(self._process(user))
+        finally:
+            for profile in profiles:
+                profile.detach_thread()
+                profile.end_part()
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            lane, _, user, records, profiles = item
+            self._queued[lane] -= 1
+            keys = self._claim(item)
+            if keys is None:
+                continue  # re-queued once its identity is free
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._run, user, profiles)
+                metrics.increment("ingest.records_processed", records)
+            except Exception as e:
+                metrics.increment("ingest.errors")
+                print(f"Failed to process ingested record: {e}")
+            finally:
+                elapsed = time.perf_counter() - started
+                self._avg_seconds = 0.9 * self._avg_seconds + 0.1 * elapsed
+                self._in_flight -= records
+                self._release_keys(keys)
+                self._queue.task_done()
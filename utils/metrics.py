@@ -0,0 +1,52 @@
+import threading
+from collections import defaultdict
+
+# Process-wide counters and gauges exposed by the /api/metrics endpoint
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+
+
+def increment(name, value=1):
+    """
+    Adds value to the named counter.
+
+    Args:
+        name (str): Counter name, dotted by area (e.g. "ingest.records_received").
+        value (int or float): Amount to add.
+    """
+    with _lock:
+        _counters[name] += value
+
+
+def get(name):
+    """
+    Returns the current value of a counter (0 if it was never incremented).
+    """
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def register_gauge(name, fn):
+    """
+    Registers a callable evaluated every time metrics are read.
+
+    Args:
+        name (str): Gauge name.
+        fn (callable): Zero-argument function returning the current value.
+    """
+    _gauges[name] = fn
+
+
+def snapshot():
+    """
+    Returns the current value of every counter and gauge.
+
+    Returns:
+        dict: Mapping of metric name to value.
+    """
+    with _lock:
+        values = dict(_counters)
+    for name, fn in _gauges.items():
+        values[name] = fn()
+    return values
@@ -0,0 +1,298 @@
+import contextvars
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+
+# Profiling is opt-in: per request with the X-Profile header matching PROFILE_TOKEN,
+# or for a random PROFILE_SAMPLE_RATE fraction of requests.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_HISTORY = int(os.getenv("PROFILE_HISTORY", "20"))
+
+# Profile of the request being handled, visible to the endpoint that spawns background work
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+_lock = threading.Lock()
+_active = set()
+_sampler = None
+_profiles = deque(maxlen=PROFILE_HISTORY)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profile:
+    """
+    Stack samples collected for one request and the background work it spawned.
+
+    Each part (the request itself, then every record handed to the ingest
+    pipeline) registers the thread it runs on; a sampler thread records the stack
+    of every registered thread at a fixed interval. The profile is complete once
+    all parts have finished.
+
+    The request part shares the event loop thread with every other request, so
+    it is registered with the frame of its own coroutine chain and only stacks
+    passing through that frame are counted.
+    """
+
+    def __init__(self, method, path):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now()
+        self.request_ms = None
+        self.total_ms = None
+        self.samples = Counter()  # "part;root frame;...;leaf frame" -> count
+        self._threads = {}  # thread id -> (part label, frame the stack must contain)
+        self._open_parts = 0
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def begin_part(self):
+        """
+        Registers background work that belongs to this profile.
+        """
+        with self._lock:
+            self._open_parts += 1
+
+    def end_part(self):
+        """
+        Marks one part as finished; the last one completes the profile.
+        """
+        with self._lock:
+            self._open_parts -= 1
+            done = self._open_parts == 0
+        if done:
+            self.total_ms = (time.perf_counter() - self._started) * 1000
+            with _lock:
+                _active.discard(self)
+
+    def attach_thread(self, label, frame=None):
+        """
+        Starts sampling the calling thread under the given part label.
+
+        Args:
+            label (str): Part label the samples are recorded under.
+            frame (frame, optional): Only count stacks containing this frame, for
+                                     threads shared with unrelated work.
+        """
+        with self._lock:
+            self._threads[threading.get_ident()] = (label, frame)
+
+    def detach_thread(self):
+        """
+        Stops sampling the calling thread.
+        """
+        with self._lock:
+            self._threads.pop(threading.get_ident(), None)
+
+    def _sample(self, frames):
+        with self._lock:
+            threads = list(self._threads.items())
+        for thread_id, (label, required) in threads:
+            frame = frames.get(thread_id)
+            stack = []
+            found = required is None
+            while frame is not None:
+                found = found or frame is required
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack and found:
+                stack.append(label)
+                self.samples[";".join(reversed(stack))] += 1
+
+    def summary(self):
+        """
+        Returns the profile metadata shown by the debug endpoint.
+        """
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at.isoformat(),
+            "request_ms": self.request_ms,
+            "total_ms": self.total_ms,
+            "complete": self.total_ms is not None,
+            "samples": sum(self.samples.values()),
+        }
+
+    def collapsed(self):
+        """
+        Returns the samples as collapsed stacks ("frame;frame;frame count" per line),
+        the input format of flamegraph.pl and speedscope.
+        """
+        return "".join(
+            f"{stack} {count}\n" for stack, count in sorted(self.samples.items())
+        )
+
+    def speedscope(self):
+        """
+        Returns the samples in speedscope's JSON file format, one profile per part.
+        """
+        frames, frame_index = [], {}
+        parts = {}
+        interval_ms = PROFILE_INTERVAL_SECONDS * 1000
+        for stack, count in sorted(self.samples.items()):
+            label, *names = stack.split(";")
+            indexes = []
+            for name in names:
+                if name not in frame_index:
+                    frame_index[name] = len(frames)
+                    frames.append({"name": name})
+                indexes.append(frame_index[name])
+            part = parts.setdefault(label, {"samples": [], "weights": []})
+            part["samples"].append(indexes)
+            part["weights"].append(count * interval_ms)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.method} {self.path} ({self.id})",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": label,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": sum(part["weights"]),
+                    "samples": part["samples"],
+                    "weights": part["weights"],
+                }
+                for label, part in parts.items()
+            ],
+        }
+
+
+def _sample_loop():
+    global _sampler
+    while True:
+        with _lock:
+            profiles = list(_active)
+            if not profiles:
+                _sampler = None
+                return
+        frames = sys._current_frames()
+        for profile in profiles:
+            profile._sample(frames)
+        del frames
+        time.sleep(PROFILE_INTERVAL_SECONDS)
+
+
+def start_profile(method, path):
+    """
+    Creates a profile, keeps it in the history and makes sure the sampler runs.
+
+    Returns:
+        Profile: The new profile, with one open part for the request itself.
+    """
+    global _sampler
+    profile = Profile(method, path)
+    profile.begin_part()
+    with _lock:
+        _profiles.append(profile)
+        _active.add(profile)
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, daemon=True)
+            _sampler.start()
+    return profile
+
+
+def current_profile():
+    """
+    Returns the profile of the request being handled, or None.
+    """
+    return _current_profile.get()
+
+
+def list_profiles():
+    """
+    Returns the summaries of the last PROFILE_HISTORY profiles, newest first.
+    """
+    with _lock:
+        profiles = list(_profiles)
+    return [profile.summary() for profile in reversed(profiles)]
+
+
+def get_profile(profile_id):
+    """
+    Returns the stored profile with the given id, or None.
+    """
+    with _lock:
+        for profile in _profiles:
+            if profile.id == profile_id:
+                return profile
+    return None
+
+
+def token_matches(token):
+    """
+    Compares a presented token with PROFILE_TOKEN in constant time.
+
+    Args:
+        token (str or bytes or None): The token from the request headers.
+
+    Returns:
+        bool: True if profiling is enabled by token and the token matches.
+    """
+    if not PROFILE_TOKEN or token is None:
+        return False
+    if isinstance(token, str):
+        token = token.encode("latin-1", errors="replace")
+    return hmac.compare_digest(token, PROFILE_TOKEN.encode("utf-8"))
+
+
+def _should_profile(scope, sample_rate):
+    if PROFILE_TOKEN:
+        for name, value in scope.get("headers", []):
+            if name == b"x-profile" and token_matches(value):
+                return True
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles opted-in requests.
+
+    When PROFILE_TOKEN is not set, requests pass straight through without any
+    extra work: profiles can only be read with the token, so random sampling
+    (PROFILE_SAMPLE_RATE) requires it too.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.sample_rate = PROFILE_SAMPLE_RATE
+        if self.sample_rate > 0 and not PROFILE_TOKEN:
+            print(
+                "PROFILE_SAMPLE_RATE is set without PROFILE_TOKEN: profiles could not "
+                "be read, so sampling is disabled"
+            )
+            self.sample_rate = 0
+        self.enabled = bool(PROFILE_TOKEN)
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or not _should_profile(scope, self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        profile = start_profile(scope.get("method"), scope.get("path"))
+        token = _current_profile.set(profile)
+        # Samples of the shared event loop thread only count while this
+        # request's coroutine chain (through this frame) is running
+        profile.attach_thread("request", sys._getframe())
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profile.request_ms = (time.perf_counter() - started) * 1000
+            profile.detach_thread()
+            _current_profile.reset(token)
+            profile.end_part()
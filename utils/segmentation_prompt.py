@@ -1,3 +1,19 @@
+# Fixed set of cohorts the model is allowed to assign users to.
+cohorts = [
+    "politics",
+    "travel",
+    "finance",
+    "fashion",
+    "movies",
+    "tech",
+    "education",
+    "photography",
+    "health",
+    "food",
+    "fitness",
+    "outdoor",
+]
+
 system_prompt = """
 You are an expert in customer segmentation. 
 You will receive:
@@ -31,7 +47,7 @@ User interests (ranked from most important to least):
 
 Available cohorts:
 ```
-["politics", "travel", "finance", "fashion", "movies", "tech", "education", "photography", "health", "food", "fitness", "outdoor"]
+{cohorts}
 ```
 
 The returned response should have only have the above mentioned cohorts.